@@ -0,0 +1,125 @@
+# Load test for concurrent questionnaire submissions: hundreds of sessions
+# submitting their details and 45 answers at the same moment.
+#
+#   python -m benchmarks.load_writes --submitters 300
+#
+# "queue" goes through insert_user / insert_responses and so through the
+# process's single writer thread with group commit. "direct" is the old
+# path for comparison: every call opens its own connection and commits on
+# its own, competing for the write lock. Latency is per submission (user
+# plus answers), measured from the moment all submitters are released.
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.synthetic import answer
+from dtl import db
+from dtl.bootstrap import init_storage
+from dtl.db import PRAGMAS, insert_answers, insert_responses, insert_user
+from dtl.questions import question_keys, questions
+
+def _answers(rng):
+    return {key: answer(item, rng) for key, item in zip(question_keys, questions)}
+
+def submit_queue(path, rng):
+    user_id = insert_user(f"user{rng.random()}", 30, "Other", "Yes")
+    insert_responses(user_id, _answers(rng))
+
+def submit_direct(path, rng):
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with conn:
+            user_id = conn.execute("""
+                INSERT INTO users (name, age, gender, knows_autonomous, timestamp) VALUES (?, 30, 'Other', 'Yes', '')
+            """, (f"user{rng.random()}",)).lastrowid
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            insert_answers(conn.cursor(), [(user_id, key, value) for key, value in _answers(rng).items()])
+    finally:
+        conn.close()
+
+MODES = {"queue": submit_queue, "direct": submit_direct}
+
+def run(mode, path, submitters, submissions):
+    submit = MODES[mode]
+    start = threading.Barrier(submitters + 1)
+    latencies, errors = [], {}
+    lock = threading.Lock()
+
+    def session(index):
+        rng = random.Random(index)
+        start.wait()
+        for _ in range(submissions):
+            started = time.perf_counter()
+            try:
+                submit(path, rng)
+            except Exception as e:
+                with lock:
+                    errors[str(e)] = errors.get(str(e), 0) + 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(submitters)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pick = lambda q: latencies[max(int(q * len(latencies)) - 1, 0)] * 1000 if latencies else None
+    return {
+        "mode": mode,
+        "submitters": submitters,
+        "submissions": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "submissions_per_s": len(latencies) / elapsed,
+        "p50_ms": pick(0.5),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent questionnaire submission load test")
+    parser.add_argument("--submitters", type=int, nargs="+", default=[50, 300])
+    parser.add_argument("--submissions", type=int, default=3, help="submissions per submitter")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--output", default=None, help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for submitters in args.submitters:
+            for mode in args.modes:
+                path = os.path.join(workdir, f"{mode}-{submitters}.db")
+                db.DB_PATH = path
+                init_storage()
+                result = run(mode, path, submitters, args.submissions)
+                results.append(result)
+                print(f"{mode:6} {submitters:4} submitters: {result['submissions_per_s']:8.1f}/s  "
+                      f"p50 {result['p50_ms'] or 0:8.1f}ms  p99 {result['p99_ms'] or 0:8.1f}ms  "
+                      f"max {result['max_ms'] or 0:8.1f}ms  errors {sum(result['errors'].values())}",
+                      file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
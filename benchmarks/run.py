@@ -0,0 +1,194 @@
+# Benchmarks for the database, forum and prompt paths at growing data sizes.
+#
+#   python -m benchmarks.run --scales 1000 10000 100000 1000000
+#
+# For each scale a synthetic database is built (see benchmarks.synthetic),
+# every path is timed over a few repeats, prompt sizes are reported as
+# characters and tokens (dtl.llm's estimate for the default model), and
+# one full regulation generation runs against the stub Ollama server in
+# dtl.fake_ollama. Results go to a JSON
+# file named after the current commit, so runs of two versions can be
+# compared key by key.
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+import dtl.llm
+from benchmarks.synthetic import make_database
+from dtl.budget import budget_clusters
+from dtl.db import clear_read_cache, fetch_data, get_comment_counts, get_comments, get_comments_for_posts, get_posts
+from dtl.embeddings import FREE_TEXT_KEYS, cluster_free_text, update_embeddings
+from dtl.fake_ollama import start_server
+from dtl.forum import build_comment_index, walk_thread
+from dtl.history import count_answers_since
+from dtl.llm import DEFAULT_MODEL, LLMClient, estimate_tokens
+from dtl.pipeline import CLUSTER_SHARD_SIZE, generate_regulations, iter_shards
+from dtl.prompts import format_statistics, prepare_cluster_prompt
+from dtl.search import search_forum
+from dtl.tasks import request_regulation_quietly
+
+DEFAULT_SCALES = (1000, 10000, 100000)
+REPEATS = 5
+
+# Cold timings of `fn`: dtl.db's read cache is cleared before every
+# repeat, so cached reads go to the database each time. With `warm`, one
+# more call straight after the last is reported as warm_ms, the cost of a
+# Streamlit rerun that is served from the cache.
+def timed(fn, repeats=REPEATS, warm=False):
+    durations = []
+    for _ in range(repeats):
+        clear_read_cache()
+        started = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - started)
+    timing = {
+        "median_ms": statistics.median(durations) * 1000,
+        "min_ms": min(durations) * 1000,
+        "repeats": repeats,
+    }
+    if warm:
+        started = time.perf_counter()
+        fn()
+        timing["warm_ms"] = (time.perf_counter() - started) * 1000
+    return result, timing
+
+# The Forum page for one feed page with every thread expanded
+def render_forum_page(before=None):
+    posts = get_posts(before=before)
+    post_ids = [post[0] for post in posts]
+    counts = get_comment_counts(post_ids)
+    index = build_comment_index(get_comments_for_posts(post_ids))
+    lines = 0
+    for post_id in post_ids:
+        lines += 1 + sum(1 for _ in walk_thread(index.get(post_id, {})))
+    return posts, counts, lines
+
+def bench_forum(results, rows):
+    timings = results["timings"]
+    posts, timings["get_posts_first_page"] = timed(get_posts, warm=True)
+    # A page deep in the feed, reached through the keyset cursor
+    deep = get_posts(limit=max(min(rows["posts"] // 2, 5000), 1))[-1]
+    _, timings["get_posts_deep_page"] = timed(lambda: get_posts(before=(deep[3], deep[0])), warm=True)
+    busiest = max(get_comment_counts([post[0] for post in posts]).items(), key=lambda item: item[1],
+                  default=(posts[0][0], 0))[0] if posts else 1
+    _, timings["get_comments_one_post"] = timed(lambda: get_comments(busiest), warm=True)
+    (_, _, lines), timings["render_forum_page"] = timed(render_forum_page, warm=True)
+    results["forum_page_lines"] = lines
+    _, timings["search_forum"] = timed(lambda: search_forum("pedestrians schools"))
+
+def bench_survey(results):
+    timings = results["timings"]
+    _, timings["fetch_data"] = timed(fetch_data, repeats=3, warm=True)
+
+# What the Regulation Generator job does before calling the model; the
+# generation then runs over the clusters that fit the token budget
+def bench_prompts(results):
+    timings = results["timings"]
+    responses = fetch_data()[1]
+    _, timings["update_embeddings"] = timed(update_embeddings, repeats=1)
+    all_clusters, timings["cluster_free_text"] = timed(lambda: cluster_free_text(responses), repeats=1)
+    (clusters, sampled), timings["budget_clusters"] = timed(lambda: budget_clusters(responses, model=DEFAULT_MODEL), repeats=1)
+    statistics_text, timings["format_statistics"] = timed(lambda: format_statistics(count_answers_since(0)[0]), repeats=1)
+    prompts, timings["prepare_map_prompts"] = timed(
+        lambda: [prepare_cluster_prompt(batch, DEFAULT_MODEL) for batch in iter_shards(clusters, CLUSTER_SHARD_SIZE)])
+    free_text = sum(len(str(row[3])) for row in responses if row[2] in FREE_TEXT_KEYS)
+    results["prompts"] = {
+        "clusters": len(all_clusters),
+        "budgeted_clusters": len(clusters),
+        "sampled_respondents": sampled,
+        "map_prompts": len(prompts),
+        "free_text_chars": free_text,
+        "map_prompt_chars": sum(map(len, prompts)),
+        "map_prompt_tokens_est": sum(estimate_tokens(prompt, DEFAULT_MODEL) for prompt in prompts),
+        "largest_map_prompt_tokens_est": max((estimate_tokens(prompt, DEFAULT_MODEL) for prompt in prompts), default=0),
+        "statistics_tokens_est": estimate_tokens(statistics_text or "", DEFAULT_MODEL),
+    }
+    return clusters, statistics_text
+
+def bench_generation(results, clusters, statistics_text, delay):
+    server = start_server(delay=delay, max_words=60)
+    previous = dtl.llm._client
+    dtl.llm._client = LLMClient(base_url=f"http://127.0.0.1:{server.server_port}")
+    try:
+        started = time.perf_counter()
+        regulations = generate_regulations(clusters, request_regulation_quietly, statistics=statistics_text,
+                                           batch_size=CLUSTER_SHARD_SIZE,
+                                           prepare=partial(prepare_cluster_prompt, model=DEFAULT_MODEL))
+        results["generation"] = {
+            "seconds": time.perf_counter() - started,
+            "requests": server.request_count,
+            "token_delay_s": delay,
+            "output_tokens_est": estimate_tokens(regulations or "", DEFAULT_MODEL),
+        }
+    finally:
+        dtl.llm._client.close()
+        dtl.llm._client = previous
+        server.shutdown()
+
+def run_scale(scale, workdir, delay, seed):
+    path = os.path.join(workdir, f"bench-{scale}.db")
+    started = time.perf_counter()
+    rows = make_database(path, scale, seed)
+    results = {"rows": rows, "build_seconds": time.perf_counter() - started, "timings": {}}
+    results["db_bytes"] = os.path.getsize(path) + (os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0)
+    bench_forum(results, rows)
+    bench_survey(results)
+    clusters, statistics_text = bench_prompts(results)
+    bench_generation(results, clusters, statistics_text, delay)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DB access, forum rendering and prompt construction")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="approximate responses and comments per database")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token-delay", type=float, default=0.001, help="stub server seconds per token")
+    parser.add_argument("--workdir", default=None, help="where to build the databases (default: a temp dir)")
+    parser.add_argument("--output", default=None, help="results file (default: benchmarks/results/<commit>.json)")
+    args = parser.parse_args(argv)
+
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for scale in args.scales:
+            print(f"Scale {scale}...", file=sys.stderr)
+            report["scales"][str(scale)] = results = run_scale(scale, workdir, args.token_delay, args.seed)
+            for name, timing in results["timings"].items():
+                warm = f" (warm {timing['warm_ms']:.2f} ms)" if "warm_ms" in timing else ""
+                print(f"  {name:32} {timing['median_ms']:10.2f} ms{warm}", file=sys.stderr)
+            print(f"  {'map prompt tokens (est.)':32} {results['prompts']['map_prompt_tokens_est']:10}", file=sys.stderr)
+            print(f"  {'generation':32} {results['generation']['seconds'] * 1000:10.2f} ms "
+                  f"({results['generation']['requests']} requests)", file=sys.stderr)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "results", f"{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
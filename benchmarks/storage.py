@@ -0,0 +1,123 @@
+# Size and scan times of the old responses table against the normalised
+# answers storage it is migrated to (see dtl.answers and dtl.migrations).
+#
+#   python -m benchmarks.storage --scale 1000000
+#
+# A database in the old layout (one TEXT row per answer) is filled with
+# synthetic respondents, copied, and the copy migrated. Both are vacuumed,
+# then the tables are measured with dbstat and the same reads are timed on
+# each: through the responses view (decoding every row) and, on the new
+# layout, straight from the integer columns. stream_respondents groups
+# the rows of the responses table or view into one dict per respondent.
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from benchmarks.run import timed
+from benchmarks.synthetic import respondents
+from dtl.migrations import migrate
+from dtl.questions import questions
+
+LEGACY_SCHEMA = """
+    CREATE TABLE responses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        question TEXT,
+        response TEXT
+    );
+    CREATE INDEX idx_responses_user ON responses (user_id);
+"""
+
+SCANS = {
+    "full_scan": ("SELECT * FROM responses", None),
+    "stream_by_user": ("SELECT user_id, question, response FROM responses ORDER BY user_id, id", None),
+    "answer_counts": ("SELECT question, response, COUNT(*) FROM responses GROUP BY question, response",
+                      "SELECT question_id, option_id, value, COUNT(*) FROM answers GROUP BY 1, 2, 3"),
+    "one_question": ("SELECT response FROM responses WHERE question = 'Q1'",
+                     "SELECT option_id FROM answers WHERE question_id = 1"),
+}
+
+def make_legacy(path, scale, seed):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    rng = random.Random(seed)
+    rows = [(user_id, key, answer) for user_id, record in enumerate(respondents(max(scale // len(questions), 1), rng), 1)
+            for key, answer in record["responses"].items()]
+    with conn:
+        conn.executemany("INSERT INTO responses (user_id, question, response) VALUES (?, ?, ?)", rows)
+    return conn
+
+def table_sizes(conn, tables):
+    try:
+        return {table: conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (table,)).fetchone()[0]
+                for table in tables}
+    except sqlite3.OperationalError:  # SQLite built without dbstat
+        return {}
+
+# Respondents as {"Q1": answer, ...} dicts, streamed in user order
+def stream_respondents(conn):
+    cursor = conn.execute(SCANS["stream_by_user"][0])
+    current_user, answers = None, {}
+    for user_id, question, response in cursor:
+        if user_id != current_user and answers:
+            yield answers
+            answers = {}
+        current_user = user_id
+        answers[question] = response
+    if answers:
+        yield answers
+
+def measure(conn, path, tables, normalised):
+    conn.execute("VACUUM")
+    results = {"file_bytes": os.path.getsize(path), "table_bytes": table_sizes(conn, tables), "timings": {}}
+    for name, (view_query, raw_query) in SCANS.items():
+        _, results["timings"][name] = timed(lambda: conn.execute(view_query).fetchall(), repeats=3)
+        if normalised and raw_query:
+            _, results["timings"][f"{name}_ids"] = timed(lambda: conn.execute(raw_query).fetchall(), repeats=3)
+    _, results["timings"]["stream_respondents"] = timed(lambda: sum(1 for _ in stream_respondents(conn)), repeats=3)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the old and the normalised responses storage")
+    parser.add_argument("--scale", type=int, default=100000, help="approximate number of answers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        legacy_path, compact_path = os.path.join(workdir, "legacy.db"), os.path.join(workdir, "compact.db")
+        legacy = make_legacy(legacy_path, args.scale, args.seed)
+        legacy.close()
+        shutil.copy(legacy_path, compact_path)
+        legacy = sqlite3.connect(legacy_path)
+        compact = sqlite3.connect(compact_path)
+        migrate(compact)
+        report = {
+            "scale": args.scale,
+            "legacy": measure(legacy, legacy_path, ("responses", "idx_responses_user"), False),
+            "normalised": measure(compact, compact_path, ("answers", "idx_answers_user",
+                                                          "survey_questions", "survey_options"), True),
+        }
+        legacy.close()
+        compact.close()
+
+    for layout in ("legacy", "normalised"):
+        results = report[layout]
+        print(f"{layout}: {results['file_bytes'] / 1e6:.1f} MB file", file=sys.stderr)
+        for table, size in results["table_bytes"].items():
+            print(f"  {table:28} {size / 1e6:10.1f} MB", file=sys.stderr)
+        for name, timing in results["timings"].items():
+            print(f"  {name:28} {timing['median_ms']:10.1f} ms", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# Synthetic data.db-shaped databases for the benchmarks.
+#
+# A database at scale N holds about N responses (N // 45 respondents who
+# answer every question), N // 20 forum posts and N comments, a third of
+# them replies to earlier comments on the same post. Answers are valid
+# against the question schema and free text is drawn from a small phrase
+# vocabulary, so clustering and search see realistic repetition. The same
+# seed always produces the same database.
+import datetime
+import os
+import random
+
+from dtl import db
+from dtl.bootstrap import init_storage
+from dtl.db import connection
+from dtl.ingest import ingest_records
+from dtl.questions import CHOICE_TYPES, GENDER_OPTIONS, KNOWS_AUTONOMOUS_OPTIONS, SLIDER_TYPES, question_keys, questions
+
+SUBJECTS = ("pedestrians", "passengers", "children", "cyclists", "animals", "the elderly", "other drivers",
+            "emergency vehicles", "manufacturers", "regulators")
+VERBS = ("should always protect", "must never harm", "need clear rules for", "should be transparent with",
+         "must share data with", "should slow down for", "have to be accountable to")
+CLAUSES = ("in every situation", "especially at night", "near schools", "on highways", "in bad weather",
+           "when sensors fail", "unless the law says otherwise", "")
+BATCH = 50000
+
+def free_text(rng):
+    return f"Vehicles {rng.choice(VERBS)} {rng.choice(SUBJECTS)} {rng.choice(CLAUSES)}".strip()
+
+def answer(item, rng):
+    if item["input_type"] in CHOICE_TYPES:
+        return rng.choice(item["options"])
+    if item["input_type"] in SLIDER_TYPES:
+        return rng.randrange(item["min"], item["max"] + 1, item["step"])
+    return free_text(rng)
+
+def respondents(count, rng):
+    for index in range(count):
+        yield {
+            "name": f"user{index}",
+            "age": rng.randint(18, 80),
+            "gender": rng.choice(GENDER_OPTIONS),
+            "knows_autonomous": rng.choice(KNOWS_AUTONOMOUS_OPTIONS),
+            "responses": {key: answer(item, rng) for key, item in zip(question_keys, questions)},
+        }
+
+def _timestamps(count, rng, start=datetime.datetime(2024, 1, 1)):
+    seconds = sorted(rng.randrange(0, 365 * 86400) for _ in range(count))
+    return [(start + datetime.timedelta(seconds=offset)).strftime("%Y-%m-%d %H:%M:%S") for offset in seconds]
+
+def _insert_forum(posts, comments, users, rng):
+    with connection() as conn:
+        conn.executemany("INSERT INTO posts (id, user_id, content, created_at) VALUES (?, ?, ?, ?)",
+                         [(post_id, rng.randint(1, users), free_text(rng), created_at)
+                          for post_id, created_at in enumerate(_timestamps(posts, rng), 1)])
+    latest = {}  # post_id -> ids of its comments so far, for picking reply parents
+    rows = []
+    for comment_id, created_at in enumerate(_timestamps(comments, rng), 1):
+        post_id = rng.randint(1, posts)
+        siblings = latest.setdefault(post_id, [])
+        parent_id = rng.choice(siblings) if siblings and rng.random() < 1 / 3 else None
+        siblings.append(comment_id)
+        rows.append((comment_id, post_id, rng.randint(1, users), parent_id, free_text(rng), created_at))
+        if len(rows) >= BATCH:
+            _insert_comments(rows)
+            rows = []
+    if rows:
+        _insert_comments(rows)
+
+def _insert_comments(rows):
+    with connection() as conn:
+        conn.executemany("""
+            INSERT INTO comments (id, post_id, user_id, parent_comment_id, content, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+
+# Creates a fresh database at `path` with about `scale` responses and
+# comments; returns the row counts. DB_PATH is pointed at it.
+def make_database(path, scale, seed=0):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.DB_PATH = path
+    init_storage()
+    rng = random.Random(seed)
+    users = max(scale // len(questions), 1)
+    ingest_records(respondents(users, rng))
+    _insert_forum(max(scale // 20, 1), scale, users, rng)
+    with connection() as conn:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("users", "responses", "posts", "comments")}
@@ -0,0 +1,203 @@
+# Command line for running the core without the Streamlit UI:
+#
+#   python -m dtl ingest respondents.csv
+#   python -m dtl export responses --format parquet --wide
+#   python -m dtl generate --output regulations.md --save
+#   python -m dtl worker --metrics-port 9100
+#   python -m dtl migrate --vacuum
+#   python -m dtl --database-url postgresql://... copy --from data.db
+#
+# Only the modules a command needs are imported, so none of these pull in
+# Streamlit and a worker process starts without the UI stack.
+import argparse
+import os
+import sys
+import time
+
+from dtl import db
+
+def ingest(args):
+    from dtl.ingest import InvalidRecord, ingest_file
+
+    def on_progress(stats):
+        print(f"{stats['respondents']} respondents, {stats['responses']} responses "
+              f"({stats['responses'] / max(stats['seconds'], 1e-9):,.0f} rows/s)", file=sys.stderr)
+
+    try:
+        stats = ingest_file(args.path, args.format, args.batch_size, args.strict, on_progress)
+    except InvalidRecord as e:
+        print(f"Invalid input, load stopped: {e}", file=sys.stderr)
+        return 1
+    for error in stats["errors"]:
+        print(f"Skipped {error}", file=sys.stderr)
+    print(f"Ingested {stats['respondents']} respondents and {stats['responses']} responses in "
+          f"{stats['seconds']:.1f}s ({stats['responses'] / max(stats['seconds'], 1e-9):,.0f} rows/s); "
+          f"{stats['rejected']} records rejected", file=sys.stderr)
+    return 1 if stats["rejected"] and not stats["respondents"] else 0
+
+def export(args):
+    from dtl.export import export_table
+    output = args.output or f"{args.table}{'_wide' if args.wide else ''}.{args.format}"
+    started = time.perf_counter()
+    count = export_table(args.table, output, args.format, args.wide)
+    print(f"Exported {count} rows from {args.table} to {output} in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+    return 0
+
+# Regulations over every stored response, through the same token budget
+# and answer clustering as the Regulation Generator's background job, so a
+# nightly run makes at most budget.max_calls() model calls
+def generate(args):
+    from dtl.budget import max_calls
+    from dtl.history import max_response_id, save_regulation
+    from dtl.llm import get_client
+    from dtl.tasks import generate_from_clusters, regulation_inputs, request_regulation_quietly
+
+    if args.model:
+        get_client().model = args.model
+    model = get_client().model
+    high_water_mark = max_response_id()
+    if high_water_mark is None:
+        print("No responses are stored yet.", file=sys.stderr)
+        return 1
+
+    def on_progress(done, total):
+        print(f"Summarised {done} of {total} shards", file=sys.stderr)
+
+    started = time.perf_counter()
+    clusters, sampled, statistics, respondents = regulation_inputs(model, 0, high_water_mark)
+    sample_note = f" (a stratified sample of {sampled})" if sampled is not None else ""
+    print(f"Summarising {len(clusters)} answer clusters from {respondents} respondents{sample_note} "
+          f"in at most {max_calls(args.fan_in)} model calls", file=sys.stderr)
+    regulations = generate_from_clusters(model, clusters, request_regulation_quietly,
+                                         statistics=statistics if args.statistics else None, on_progress=on_progress,
+                                         fan_in=args.fan_in, max_workers=args.workers)
+    if not regulations:
+        print("No regulations were generated. Check the API or input data.", file=sys.stderr)
+        return 1
+    print(f"Generated regulations in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(regulations)
+    else:
+        print(regulations)
+    if args.save:
+        save_regulation(model, regulations, high_water_mark)
+    return 0
+
+# Runs background jobs (e.g. regulations enqueued by the app) until
+# interrupted, serving the job and model call metrics at /metrics
+def worker(args):
+    import dtl.tasks  # registers the job handlers
+    from dtl.jobs import start_workers
+    from dtl.metrics import start_metrics_server
+    pool = start_workers(args.workers)
+    print(f"Running {args.workers} job workers on {db.get_backend().name}", file=sys.stderr)
+    server = start_metrics_server(args.metrics_port)
+    if server is not None:
+        print(f"Serving metrics on port {server.server_port}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+    return 0
+
+# Pending migrations have already run in init_storage; this reports the
+# schema version and, on SQLite, optionally rewrites the file to give back
+# the space of the tables they dropped
+def migrate(args):
+    from dtl.migrations import SCHEMA_VERSION, schema_version
+    if db.get_backend().dialect != "sqlite":
+        from dtl import postgres
+        with db.connection() as conn:
+            print(f"{db.get_backend().name} is at server schema version {postgres.schema_version(conn.cursor())} "
+                  f"(latest {postgres.SCHEMA_VERSION})", file=sys.stderr)
+        return 0
+    with db.connection() as conn:
+        print(f"{db.DB_PATH} is at schema version {schema_version(conn)} (latest {SCHEMA_VERSION})", file=sys.stderr)
+    if args.vacuum:
+        before = os.path.getsize(db.DB_PATH)
+        started = time.perf_counter()
+        with db.connection() as conn:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"Vacuumed {before / 1e6:,.1f} MB to {os.path.getsize(db.DB_PATH) / 1e6:,.1f} MB in "
+              f"{time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+# Fills the configured (empty) database from another one
+def copy(args):
+    from dtl.transfer import copy_database
+
+    def on_table(table, rows, seconds):
+        print(f"Copied {rows} rows of {table} in {seconds:.1f}s", file=sys.stderr)
+
+    try:
+        copy_database(args.source, on_table)
+    except ValueError as e:
+        print(f"Not copied: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+def main(argv=None):
+    from dtl.bootstrap import init_storage
+    from dtl.export import EXPORT_FORMATS, EXPORT_TABLES
+    from dtl.ingest import BATCH_SIZE, INGEST_FORMATS
+    from dtl.jobs import WORKERS
+    from dtl.llm import DEFAULT_MODEL
+    from dtl.pipeline import MAX_WORKERS, REDUCE_FAN_IN
+
+    parser = argparse.ArgumentParser(prog="python -m dtl", description="DTL regulation generator without the UI")
+    parser.add_argument("--db", default=db.DB_PATH, help="SQLite database (default: %(default)s)")
+    parser.add_argument("--database-url", default=db.DATABASE_URL,
+                        help="PostgreSQL database to use instead (default: $DTL_DATABASE_URL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("ingest", help="bulk load respondents from a CSV or JSONL file")
+    command.add_argument("path")
+    command.add_argument("--format", choices=INGEST_FORMATS, default=None, help="default: from the file extension")
+    command.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="respondents per transaction")
+    command.add_argument("--strict", action="store_true", help="stop at the first invalid record")
+    command.set_defaults(handler=ingest)
+
+    command = commands.add_parser("export", help="write a table as CSV, JSONL or Parquet")
+    command.add_argument("table", choices=EXPORT_TABLES)
+    command.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    command.add_argument("--wide", action="store_true", help="responses only: one row per respondent")
+    command.add_argument("--output", default=None, help="file to write (default: <table>.<format>)")
+    command.set_defaults(handler=export)
+
+    command = commands.add_parser("generate", help="generate regulations from all stored responses")
+    command.add_argument("--model", default=None, help="Ollama model (default: %s)" % DEFAULT_MODEL)
+    command.add_argument("--no-statistics", dest="statistics", action="store_false",
+                         help="leave the aggregated closed-ended answers out of the final prompt")
+    command.add_argument("--fan-in", type=int, default=REDUCE_FAN_IN)
+    command.add_argument("--workers", type=int, default=MAX_WORKERS)
+    command.add_argument("--output", default=None, help="write the regulations here instead of stdout")
+    command.add_argument("--save", action="store_true", help="record the result in the regulation history")
+    command.set_defaults(handler=generate)
+
+    command = commands.add_parser("worker", help="run background jobs without the UI")
+    command.add_argument("--workers", type=int, default=WORKERS)
+    command.add_argument("--metrics-port", type=int, default=None,
+                         help="serve Prometheus metrics on this port (default: DTL_METRICS_PORT, if set)")
+    command.set_defaults(handler=worker)
+
+    command = commands.add_parser("migrate", help="bring the database schema up to date")
+    command.add_argument("--vacuum", action="store_true", help="then compact the file")
+    command.set_defaults(handler=migrate)
+
+    command = commands.add_parser("copy", help="copy all data from another database into this (empty) one")
+    command.add_argument("--from", dest="source", required=True, help="SQLite file or postgresql:// URL")
+    command.set_defaults(handler=copy)
+
+    args = parser.parse_args(argv)
+    db.DB_PATH, db.DATABASE_URL = args.db, args.database_url
+    init_storage()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
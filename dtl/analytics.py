@@ -0,0 +1,36 @@
+# Demographic sampling of respondents.
+#
+# users rows are read into a frame with an age band next to gender and
+# knows_autonomous, and samples are drawn per stratum of those three, so a
+# sample keeps the demographic mix of the whole set (see dtl.budget).
+import pandas as pd
+
+DEMOGRAPHICS = ("gender", "age_band", "knows_autonomous")
+AGE_BINS = [0, 17, 24, 34, 49, 64, 120]
+AGE_LABELS = ["<18", "18-24", "25-34", "35-49", "50-64", "65+"]
+
+# Accepts either fetch_data()-style tuples or a frame already read with pd.read_sql
+def _frame(rows, columns):
+    if isinstance(rows, pd.DataFrame):
+        return rows.set_axis(columns, axis=1)
+    return pd.DataFrame(rows, columns=columns)
+
+# Age, age band, gender and knows_autonomous of users-table rows, indexed by user_id
+def demographic_frame(users):
+    demographics = _frame(users, ["user_id", "name", "age", "gender", "knows_autonomous", "timestamp"])
+    demographics = demographics.set_index("user_id")[["age", "gender", "knows_autonomous"]]
+    demographics["age"] = pd.to_numeric(demographics["age"], errors="coerce").astype("Int64")
+    demographics["age_band"] = pd.cut(demographics["age"].astype("float"), bins=AGE_BINS, labels=AGE_LABELS)
+    demographics["gender"] = demographics["gender"].astype("category")
+    demographics["knows_autonomous"] = demographics["knows_autonomous"].astype("category")
+    return demographics
+
+# Ids of about `size` of the `users` rows, drawn from every gender x age
+# band x knows_autonomous stratum in proportion to its size, so the sample
+# keeps the mix of the whole set. The same seed gives the same sample.
+def stratified_sample(users, size, seed=0):
+    demographics = demographic_frame(users)
+    if size >= len(demographics):
+        return list(demographics.index)
+    strata = demographics.groupby(list(DEMOGRAPHICS), observed=True, dropna=False)
+    return sorted(strata.sample(frac=size / len(demographics), random_state=seed).index)
@@ -0,0 +1,187 @@
+# Compact storage for survey answers.
+#
+# Every answer used to be a (user_id, question, response) row repeating the
+# question key and, for choices and sliders, the answer as text. Questions
+# and choice options are now numbered once in survey_questions and
+# survey_options, and an answer is a row of small integers in `answers`:
+# the option id of a choice or the number picked on a slider. Only answers
+# to free-text questions keep text, in answers.response, which is also the
+# content of the full-text index. The `responses` view
+# decodes rows back to (id, user_id, question, response) with the response
+# as text, exactly as the old table stored it, so readers are unchanged.
+# Writers go through dtl.db.insert_answers. The SQL here runs on SQLite
+# and PostgreSQL alike; the tables themselves are created by
+# create_answer_tables or dtl.postgres.
+import threading
+
+from dtl.questions import CHOICE_TYPES, SLIDER_TYPES, question_keys, questions
+
+def question_kind(item):
+    if item["input_type"] in CHOICE_TYPES:
+        return "choice"
+    if item["input_type"] in SLIDER_TYPES:
+        return "slider"
+    return "text"
+
+# Body of the responses view. Labels are joined on their primary keys
+# rather than looked up by a subquery per row, so queries over the view
+# are planned as one join (e.g. a scan of idx_answers_user for ORDER BY
+# user_id, id), and free text is read from the answers row itself.
+RESPONSES_QUERY = """
+    SELECT answers.id, answers.user_id, survey_questions.key,
+           COALESCE(survey_options.label, CAST(answers.value AS TEXT), answers.response)
+    FROM answers
+    JOIN survey_questions ON survey_questions.id = answers.question_id
+    LEFT JOIN survey_options ON survey_options.question_id = answers.question_id
+                            AND survey_options.option_id = answers.option_id
+"""
+
+def create_answer_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS survey_questions (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS survey_options (
+            question_id INTEGER NOT NULL,
+            option_id INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            PRIMARY KEY (question_id, option_id),
+            UNIQUE (question_id, label),
+            FOREIGN KEY (question_id) REFERENCES survey_questions (id)
+        ) WITHOUT ROWID
+    """)
+    # option_id is set for choices (and for anything else that is not a
+    # plain integer), value for slider numbers, response for free text
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            question_id INTEGER NOT NULL,
+            option_id INTEGER,
+            value INTEGER,
+            response TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (question_id) REFERENCES survey_questions (id)
+        )
+    """)
+    # Lets the wide export stream respondents in order without a sort
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_answers_user ON answers (user_id)")
+    cursor.execute(f"CREATE VIEW IF NOT EXISTS responses (id, user_id, question, response) AS {RESPONSES_QUERY}")
+    sync_survey(cursor)
+
+# Numbers the questions and options of the current schema. Existing ids are
+# kept, so new questions and options are appended and old answers keep
+# their meaning even if the schema is reordered.
+def sync_survey(cursor):
+    cursor.executemany("INSERT INTO survey_questions (key, kind) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                       [(key, question_kind(item)) for key, item in zip(question_keys, questions)])
+    numbered = set(cursor.execute("""
+        SELECT key, label FROM survey_options JOIN survey_questions ON survey_questions.id = survey_options.question_id
+    """).fetchall())
+    for key, item in zip(question_keys, questions):
+        for label in item.get("options", ()):
+            if (key, label) not in numbered:
+                _add_option(cursor, key, label)
+
+def _add_option(cursor, key, label):
+    # Locks the question's row until commit, so that writers sharing a
+    # server database number its new options one at a time
+    cursor.execute("UPDATE survey_questions SET kind = kind WHERE key = ?", (key,))
+    cursor.execute("""
+        INSERT INTO survey_options (question_id, option_id, label)
+        SELECT id, (SELECT COALESCE(MAX(option_id) + 1, 0) FROM survey_options WHERE question_id = survey_questions.id), ?
+        FROM survey_questions WHERE key = ?
+        ON CONFLICT DO NOTHING
+    """, (label, key))
+
+
+# Lookup tables of one database, loaded once per process. Only the current
+# schema's questions and options are cached; other keys and labels (answers
+# to questions since removed, labels since renamed) are looked up or added
+# in SQL on every use, because the write adding them may be rolled back.
+class AnswerCodec:
+    def __init__(self, cursor):
+        schema = {key: set(item.get("options", ())) for key, item in zip(question_keys, questions)}
+        self.questions = {key: (question_id, kind) for question_id, key, kind
+                          in cursor.execute("SELECT id, key, kind FROM survey_questions") if key in schema}
+        self.options = {(question_id, label): option_id for question_id, key, option_id, label in cursor.execute("""
+            SELECT question_id, key, option_id, label
+            FROM survey_options JOIN survey_questions ON survey_questions.id = survey_options.question_id
+        """) if label in schema.get(key, ())}
+
+    def question(self, cursor, key):
+        found = self.questions.get(key)
+        if found is None:
+            cursor.execute("INSERT INTO survey_questions (key, kind) VALUES (?, 'text') ON CONFLICT DO NOTHING", (key,))
+            found = cursor.execute("SELECT id, kind FROM survey_questions WHERE key = ?", (key,)).fetchone()
+        return found
+
+    def option(self, cursor, question_id, key, label):
+        option_id = self.options.get((question_id, label))
+        if option_id is None:
+            _add_option(cursor, key, label)
+            option_id = cursor.execute("SELECT option_id FROM survey_options WHERE question_id = ? AND label = ?",
+                                       (question_id, label)).fetchone()[0]
+        return option_id
+
+    # (question_id, option_id, value, text) of one answer; text is None
+    # unless the answer is free text
+    def encode(self, cursor, key, response):
+        question_id, kind = self.question(cursor, key)
+        if response is None:
+            return question_id, None, None, None
+        if kind == "text":
+            return question_id, None, None, str(response)
+        if kind == "slider":
+            number = _integer(response)
+            if number is not None:
+                return question_id, None, number, None
+        return question_id, self.option(cursor, question_id, key, str(response)), None, None
+
+def _integer(response):
+    # Only integers that read back as the same text, so the view is lossless
+    if isinstance(response, int) and not isinstance(response, bool):
+        return response
+    if isinstance(response, str):
+        try:
+            number = int(response)
+        except ValueError:
+            return None
+        return number if str(number) == response else None
+    return None
+
+
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+# Codec for the database `cursor` is on; `database` names it for reuse
+# across calls, without it the lookup tables are read for this call only
+def get_codec(cursor, database=None):
+    with _codecs_lock:
+        codec = _codecs.get(database)
+    if codec is None:
+        codec = AnswerCodec(cursor)
+        if database and database != ":memory:":  # in-memory databases are not shared
+            with _codecs_lock:
+                _codecs[database] = codec
+    return codec
+
+# Forgets the lookup tables read so far, e.g. after a database's survey
+# numbering has been replaced
+def clear_codecs():
+    with _codecs_lock:
+        _codecs.clear()
+
+# Stores (answer_id, user_id, question, response) rows
+def store_answers(cursor, rows, database=None):
+    codec = get_codec(cursor, database)
+    encoded = [(answer_id, user_id, *codec.encode(cursor, question, response))
+               for answer_id, user_id, question, response in rows]
+    cursor.executemany("""
+        INSERT INTO answers (id, user_id, question_id, option_id, value, response) VALUES (?, ?, ?, ?, ?, ?)
+    """, encoded)
+    return len(encoded)
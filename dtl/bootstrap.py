@@ -0,0 +1,18 @@
+# Schema setup shared by the Streamlit app, the command line and workers.
+# Creating tables and indexes is idempotent, so every entry point calls it.
+from dtl.cache import init_cache
+from dtl.db import get_backend, init_db
+from dtl.embeddings import init_embeddings
+from dtl.history import init_history
+from dtl.jobs import init_jobs
+from dtl.search import init_search
+
+def init_storage():
+    init_db()
+    if get_backend().dialect != "sqlite":
+        return  # init_db created the whole server schema
+    init_cache()
+    init_history()
+    init_embeddings()
+    init_search()
+    init_jobs()
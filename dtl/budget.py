@@ -0,0 +1,87 @@
+# Token budget for one regulation generation, so its worst-case duration
+# does not grow with the number of stored responses.
+#
+# Every call is bounded: free-text answers are clipped to MAX_ANSWER_TOKENS,
+# so a map prompt of CLUSTER_SHARD_SIZE clusters stays well inside
+# CONTEXT_TOKENS, and every answer is capped at OUTPUT_TOKENS. The map step
+# is bounded by MAX_MAP_PROMPTS prompts and MAP_INPUT_TOKENS estimated
+# prompt tokens in total, and with it the reduce tree above it. When the
+# answer clusters of all respondents would exceed that, or there are more
+# than MAX_CLUSTERED_ANSWERS free-text answers to cluster, a stratified
+# sample of respondents (by gender, age band and knows_autonomous) is
+# clustered instead, shrinking until it fits; if clustering still leaves
+# too much, the smallest clusters are dropped. Clustering therefore never
+# sees more than MAX_CLUSTERED_ANSWERS answers, however many are stored.
+# The closed-ended statistics are always computed over every respondent.
+from functools import partial
+
+from dtl.db import get_users
+from dtl.embeddings import cluster_free_text, free_text_answers
+from dtl.llm import estimate_tokens
+from dtl.pipeline import CLUSTER_SHARD_SIZE, REDUCE_FAN_IN, iter_shards
+from dtl.prompts import prepare_cluster_prompt
+
+MAX_MAP_PROMPTS = 16
+MAP_INPUT_TOKENS = 48000
+MAX_CLUSTERED_ANSWERS = 3000  # clustering is quadratic in the answers to a question
+SAMPLING_ROUNDS = 4
+SAMPLE_MARGIN = 0.9  # clusters shrink more slowly than the sample, so aim a little low
+
+# (map prompts, estimated prompt tokens) for summarising `clusters`; the
+# prompts are built exactly as the job will build them for `model`
+def map_cost(clusters, model=None):
+    prepare = partial(prepare_cluster_prompt, model=model)
+    prompts = [prompt for prompt in map(prepare, iter_shards(clusters, CLUSTER_SHARD_SIZE)) if prompt]
+    return len(prompts), sum(estimate_tokens(prompt, model) for prompt in prompts)
+
+# How many times over budget a map step of this cost is (<= 1 fits)
+def overrun(cost):
+    prompts, tokens = cost
+    return max(prompts / MAX_MAP_PROMPTS, tokens / MAP_INPUT_TOKENS)
+
+# Upper bound on model calls for one generation: the map prompts, the
+# merges of the reduce tree and the final consolidation
+def max_calls(fan_in=REDUCE_FAN_IN):
+    calls, partials = MAX_MAP_PROMPTS, MAX_MAP_PROMPTS
+    while partials > fan_in:
+        partials = -(-partials // fan_in)
+        calls += partials
+    return calls + 1
+
+# The `keep` largest clusters, in their original order
+def _largest(clusters, keep):
+    ranked = sorted(range(len(clusters)), key=lambda index: -clusters[index][2])[:keep]
+    return [clusters[index] for index in sorted(ranked)]
+
+# Answer clusters of `responses` rows that fit the budget, and the number
+# of respondents sampled for them (None when no sample was needed). The
+# sample is drawn with `seed`, so the same snapshot gives the same prompts.
+def budget_clusters(responses, seed=0, model=None):
+    answers = free_text_answers(responses)
+    rows, users, sampled = answers, None, None
+    size = len({row[1] for row in answers})
+    for _ in range(SAMPLING_ROUNDS + 1):
+        # More answers than can be clustered is over budget before any
+        # prompt is built
+        over = len(rows) / MAX_CLUSTERED_ANSWERS
+        if over <= 1:
+            clusters = cluster_free_text(rows)
+            over = overrun(map_cost(clusters, model))
+            if over <= 1:
+                return clusters, sampled
+        if users is None:
+            # pandas is only needed when sampling, so it is loaded on first use
+            from dtl.analytics import stratified_sample
+            users = get_users(sorted({row[1] for row in answers}))
+        size = int(size / over * SAMPLE_MARGIN)
+        if size < 1:
+            break
+        keep = set(stratified_sample(users, size, seed))
+        rows = [row for row in answers if row[1] in keep]
+        sampled = len(keep)
+
+    clusters = cluster_free_text(rows[:MAX_CLUSTERED_ANSWERS])
+    keep = min(len(clusters), MAX_MAP_PROMPTS * CLUSTER_SHARD_SIZE)
+    while keep and overrun(map_cost(_largest(clusters, keep), model)) > 1:
+        keep = int(keep * SAMPLE_MARGIN)
+    return _largest(clusters, keep), sampled
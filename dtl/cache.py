@@ -0,0 +1,82 @@
+# Content-addressed cache of generated regulations.
+#
+# Entries are keyed by a hash of the model, the prompt template, the
+# pipeline, clustering and token budget parameters and the exact response
+# rows that were aggregated, so a rerun over the same snapshot is a single
+# primary-key lookup. A trigger on answers clears the cache whenever new
+# ones land, and old entries are evicted by TTL and least-recent use.
+import hashlib
+import json
+import time
+
+from dtl.budget import MAP_INPUT_TOKENS, MAX_MAP_PROMPTS
+from dtl.db import connection
+from dtl.embeddings import DIM, SIMILARITY_THRESHOLD
+from dtl.llm import CONTEXT_TOKENS, OUTPUT_TOKENS
+from dtl.metrics import instrumented
+from dtl.pipeline import CLUSTER_SHARD_SIZE, REDUCE_FAN_IN
+from dtl.prompts import MAX_ANSWER_TOKENS, PROMPT_TEMPLATE
+
+MAX_ENTRIES = 32
+TTL_SECONDS = 7 * 24 * 3600
+
+def init_cache():
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS regulation_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                regulations TEXT,
+                created_at REAL,
+                last_used REAL
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS regulation_cache_invalidate
+            AFTER INSERT ON answers
+            BEGIN
+                DELETE FROM regulation_cache;
+            END
+        """)
+
+def regulation_key(model, responses):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([model, PROMPT_TEMPLATE, CLUSTER_SHARD_SIZE, REDUCE_FAN_IN,
+                              DIM, SIMILARITY_THRESHOLD, MAX_ANSWER_TOKENS, MAX_MAP_PROMPTS, MAP_INPUT_TOKENS,
+                              CONTEXT_TOKENS, OUTPUT_TOKENS]).encode())
+    for row in sorted(responses):
+        digest.update(json.dumps(row, default=str).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+@instrumented()
+def get_cached_regulations(key):
+    now = time.time()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT regulations FROM regulation_cache WHERE key = ? AND created_at >= ?",
+                       (key, now - TTL_SECONDS))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute("UPDATE regulation_cache SET last_used = ? WHERE key = ?", (now, key))
+    return row[0] if row else None
+
+@instrumented()
+def cache_regulations(key, model, regulations):
+    now = time.time()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO regulation_cache (key, model, regulations, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET model = excluded.model, regulations = excluded.regulations,
+                                            created_at = excluded.created_at, last_used = excluded.last_used
+        """, (key, model, regulations, now, now))
+        # Evict expired entries, then everything beyond the MAX_ENTRIES most recently used
+        cursor.execute("DELETE FROM regulation_cache WHERE created_at < ?", (now - TTL_SECONDS,))
+        cursor.execute("""
+            DELETE FROM regulation_cache WHERE key NOT IN (
+                SELECT key FROM regulation_cache ORDER BY last_used DESC LIMIT ?
+            )
+        """, (MAX_ENTRIES,))
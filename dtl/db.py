@@ -0,0 +1,507 @@
+# Data-access layer for data.db, or for a PostgreSQL server when the app
+# runs as several replicas (set DTL_DATABASE_URL, see dtl.postgres).
+#
+# The functions below are the same for both; get_backend() picks the
+# storage for this process and connection() and write() go through it.
+# On SQLite, connections are opened once per process and reused from a
+# small pool instead of per call, and each one is configured for
+# concurrent Streamlit sessions: WAL lets readers run alongside the single
+# writer, busy_timeout makes writers wait for the lock instead of failing
+# with "database is locked", and mmap serves reads straight from the page
+# cache.
+import datetime
+import functools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from dtl.answers import create_answer_tables, store_answers
+from dtl.metrics import instrumented
+from dtl.migrations import migrate
+
+DB_PATH = os.environ.get("DTL_DB_PATH", "data.db")
+DATABASE_URL = os.environ.get("DTL_DATABASE_URL")  # a server database; overrides DB_PATH
+SERVER_SCHEMES = ("postgresql://", "postgres://")
+POOL_SIZE = 8
+POSTS_PER_PAGE = 20
+READ_CACHE_SIZE = 256  # cached read results kept per process
+READ_CACHE_TTL = 300  # seconds; a backstop, invalidation is by version
+VERSIONED_TABLES = ("users", "responses", "posts", "comments")
+STORED_IN = {"responses": ("answers",)}  # tables behind a versioned view
+MAX_GROUP_WRITES = 256  # submissions committed together by the writer thread
+WRITE_RETRIES = 3
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self):
+        # Streamlit reruns on fresh threads, so pooled connections must cross threads;
+        # the pool hands each one to a single thread at a time
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._open()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Per-process pool; a forked worker gets its own connections
+def get_pool(path=None):
+    path = path or DB_PATH
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+# Borrow a pooled connection; the block runs as one transaction. `path`
+# picks a SQLite file other than the configured database.
+def connection(path=None):
+    return (SQLiteBackend(path) if path else get_backend()).connection()
+
+
+# Single writer per process. Inserts from all sessions go through one
+# queue to a dedicated thread with its own connection, which takes every
+# write waiting in the queue (up to MAX_GROUP_WRITES), runs each in its own
+# savepoint and commits them together: one lock acquisition and one WAL
+# sync for the whole group instead of one per submission. Each caller gets
+# a Future that resolves after the commit with its write's result (e.g.
+# the new user id), or with the exception that write raised; a failing
+# write is rolled back to its savepoint without affecting the others.
+class WriteQueue:
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    # Queue op(cursor) -> result; returns a Future for the result
+    def submit(self, op):
+        future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def _take_group(self):
+        group = [self._queue.get()]
+        while len(group) < MAX_GROUP_WRITES:
+            try:
+                group.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return group
+
+    def _run(self):
+        conn = get_pool(self.path)._open()
+        while True:
+            group = self._take_group()
+            for attempt in range(WRITE_RETRIES + 1):
+                try:
+                    results = self._commit(conn, group)
+                    break
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    # Retry only when another process held the lock past busy_timeout
+                    if attempt == WRITE_RETRIES or not _is_busy(e):
+                        results = [e] * len(group)
+                        break
+                    time.sleep(0.05 * 2 ** attempt)
+            for (_, future), result in zip(group, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _commit(self, conn, group):
+        results = []
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        for op, _ in group:
+            cursor.execute("SAVEPOINT write")
+            try:
+                results.append(op(cursor))
+            except Exception as e:
+                if _is_busy(e):
+                    raise
+                cursor.execute("ROLLBACK TO write")
+                results.append(e)
+            cursor.execute("RELEASE write")
+        conn.commit()
+        return results
+
+
+def _is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(path=None):
+    path = path or DB_PATH
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None or writer.pid != os.getpid():
+            writer = _writers[path] = WriteQueue(path)
+        return writer
+
+# Runs op(cursor) in a write transaction (on SQLite, on the writer thread)
+# and waits for it to commit
+def write(op, path=None):
+    return (SQLiteBackend(path) if path else get_backend()).write(op)
+
+
+# Storage in a local SQLite file, through the pool and writer above
+class SQLiteBackend:
+    dialect = "sqlite"
+
+    def __init__(self, path):
+        self.path = self.name = path
+        self.pid = os.getpid()
+
+    @contextmanager
+    def connection(self):
+        pool = get_pool(self.path)
+        conn = pool.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            pool.release(conn)
+
+    def write(self, op):
+        return get_writer(self.path).submit(op).result()
+
+    # Ids for `count` new rows of an AUTOINCREMENT table; the caller holds
+    # the write lock, so they are the next ones in sqlite_sequence
+    def next_ids(self, cursor, table, count):
+        first = cursor.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0) + 1",
+                               (table,)).fetchone()[0]
+        return range(first, first + count)
+
+    def reset_ids(self, cursor, table):
+        pass  # explicit ids already move sqlite_sequence on
+
+    # Subquery over the elements of a JSON array parameter
+    def json_values(self, sql_type):
+        return "SELECT value FROM json_each(?)"
+
+    def stream_cursor(self, conn):
+        return conn.cursor()
+
+    # {column: declared type} of a table or view
+    def column_types(self, cursor, table):
+        return {name: declared for _, name, declared, *_ in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+
+    def bulk_insert(self, cursor, table, columns, rows):
+        cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                           rows)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+# SQLite file or postgresql:// URL -> backend; each call opens new pools
+def open_backend(target):
+    if target.startswith(SERVER_SCHEMES):
+        from dtl.postgres import PostgresBackend
+        return PostgresBackend(target)
+    return SQLiteBackend(target)
+
+# This process's backend for DATABASE_URL, or else DB_PATH
+def get_backend():
+    target = DATABASE_URL or DB_PATH
+    with _backends_lock:
+        backend = _backends.get(target)
+        if backend is None or backend.pid != os.getpid():
+            backend = _backends[target] = open_backend(target)
+        return backend
+
+# Initialize the database. A server database gets its whole schema here,
+# including the tables of the other init_* functions (see dtl.postgres).
+def init_db():
+    backend = get_backend()
+    if backend.dialect != "sqlite":
+        backend.init_schema()
+        return
+    with connection() as conn:
+        cursor = conn.cursor()
+        # Create tables if not exists
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                age INTEGER,
+                gender TEXT,
+                knows_autonomous TEXT,
+                timestamp TEXT
+            )
+        """)
+        # Create posts table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            )
+        ''')
+
+        # Create comments table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS comments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                post_id INTEGER,
+                user_id INTEGER,
+                parent_comment_id INTEGER,
+                content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(post_id) REFERENCES posts(id),
+                FOREIGN KEY(user_id) REFERENCES users(id),
+                FOREIGN KEY(parent_comment_id) REFERENCES comments(id)
+            )
+        ''')
+
+        # Indexes for the paginated feed and per-post thread lookups
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts (created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_comments_post_parent ON comments (post_id, parent_comment_id)")
+
+        # Answers are stored normalised (see dtl.answers) behind a responses view
+        migrate(conn)
+        create_answer_tables(cursor)
+
+        # One counter per table, bumped by triggers on every write from any
+        # process; cached reads compare it to the version they were read at
+        cursor.execute("CREATE TABLE IF NOT EXISTS data_version (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        cursor.executemany("INSERT OR IGNORE INTO data_version (name, version) VALUES (?, 0)",
+                           [(table,) for table in VERSIONED_TABLES])
+        for name in VERSIONED_TABLES:
+            for table in STORED_IN.get(name, (name,)):
+                for event, suffix in (("INSERT", "ai"), ("UPDATE", "au"), ("DELETE", "ad")):
+                    cursor.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+                            UPDATE data_version SET version = version + 1 WHERE name = '{name}';
+                        END
+                    """)
+
+# Read cache. Results of the decorated reads are kept per process, keyed by
+# database, function and arguments, together with the versions of the
+# tables they read. A hit costs one primary-key scan of data_version
+# instead of the query, and any write to those tables, from this process
+# or another one sharing the database, makes the entry stale. Cached
+# results are shared between sessions, so callers must not modify them.
+_read_cache = OrderedDict()
+_read_cache_lock = threading.Lock()
+
+def table_versions():
+    with connection() as conn:
+        return dict(conn.execute("SELECT name, version FROM data_version").fetchall())
+
+# The database is part of the key: two databases (e.g. the benchmark
+# fixtures) can have equal table versions, and must not share entries
+def _cache_key(fn, args, kwargs):
+    freeze = lambda value: tuple(value) if isinstance(value, (list, set)) else value
+    return (get_backend().name, fn.__module__, fn.__qualname__, tuple(map(freeze, args)),
+            tuple(sorted((name, freeze(value)) for name, value in kwargs.items())))
+
+def cached_read(*tables):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = _cache_key(fn, args, kwargs)
+            versions = table_versions()
+            stamp = tuple(versions.get(table) for table in tables)
+            now = time.monotonic()
+            with _read_cache_lock:
+                entry = _read_cache.get(key)
+                if entry is not None and entry[0] == stamp and entry[1] > now:
+                    _read_cache.move_to_end(key)
+                    return entry[2]
+            result = fn(*args, **kwargs)
+            with _read_cache_lock:
+                _read_cache[key] = (stamp, now + READ_CACHE_TTL, result)
+                _read_cache.move_to_end(key)
+                while len(_read_cache) > READ_CACHE_SIZE:
+                    _read_cache.popitem(last=False)
+            return result
+        return wrapper
+    return decorate
+
+def clear_read_cache():
+    with _read_cache_lock:
+        _read_cache.clear()
+
+# Insert user details into the database
+@instrumented()
+def insert_user(name, age, gender, knows_autonomous):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def op(cursor):
+        cursor.execute("""
+            INSERT INTO users (name, age, gender, knows_autonomous, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+            RETURNING id
+        """, (name, age, gender, knows_autonomous, timestamp))
+        return cursor.fetchone()[0]
+    return write(op)
+
+# Stores (user_id, question, response) rows; returns how many. Must run in
+# a write transaction (write(), or BEGIN IMMEDIATE on SQLite), since answer
+# ids are assigned up front to pair free text with its answer.
+def insert_answers(cursor, rows):
+    backend = get_backend()
+    answer_ids = backend.next_ids(cursor, "answers", len(rows))
+    return store_answers(cursor, [(answer_id, *row) for answer_id, row in zip(answer_ids, rows)], backend.name)
+
+# Insert responses into the database
+@instrumented()
+def insert_responses(user_id, responses):
+    rows = [(user_id, question, response) for question, response in responses.items()]
+    write(lambda cursor: insert_answers(cursor, rows))
+
+# Fetch data for regulation generation; its metric counts users and response rows
+@instrumented(rows=lambda result: sum(map(len, result)))
+@cached_read("users", "responses")
+def fetch_data():
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users")
+        users = cursor.fetchall()
+        cursor.execute("SELECT * FROM responses")
+        responses = cursor.fetchall()
+    return users, responses
+
+# Functions to handle posts and comments
+@instrumented()
+def insert_post(user_id, content):
+    write(lambda cursor: cursor.execute("INSERT INTO posts (user_id, content) VALUES (?, ?)", (user_id, content)))
+
+@instrumented()
+def insert_comment(post_id, user_id, content, parent_comment_id=None):
+    write(lambda cursor: cursor.execute(
+        "INSERT INTO comments (post_id, user_id, content, parent_comment_id) VALUES (?, ?, ?, ?)",
+        (post_id, user_id, content, parent_comment_id)
+    ))
+
+# One page of the forum feed, newest first. Keyset pagination: pass the
+# (created_at, id) of the last post on the previous page as `before`
+@instrumented()
+@cached_read("posts", "users")
+def get_posts(before=None, limit=POSTS_PER_PAGE):
+    with connection() as conn:
+        cursor = conn.cursor()
+        if before is None:
+            cursor.execute("""
+                SELECT posts.id, users.name, posts.content, posts.created_at
+                FROM posts
+                JOIN users ON posts.user_id = users.id
+                ORDER BY posts.created_at DESC, posts.id DESC
+                LIMIT ?
+            """, (limit,))
+        else:
+            cursor.execute("""
+                SELECT posts.id, users.name, posts.content, posts.created_at
+                FROM posts
+                JOIN users ON posts.user_id = users.id
+                WHERE (posts.created_at, posts.id) < (?, ?)
+                ORDER BY posts.created_at DESC, posts.id DESC
+                LIMIT ?
+            """, (*before, limit))
+        return cursor.fetchall()
+
+# {post_id: number of comments} for the given posts
+@instrumented()
+@cached_read("comments")
+def get_comment_counts(post_ids):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT post_id, COUNT(*) FROM comments
+            WHERE post_id IN ({get_backend().json_values("BIGINT")})
+            GROUP BY post_id
+        """, (json.dumps(list(post_ids)),))
+        return dict(cursor.fetchall())
+
+@instrumented()
+@cached_read("comments", "users")
+def get_comments(post_id):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT comments.id, comments.post_id, comments.user_id, comments.content, comments.created_at,
+                   comments.parent_comment_id, users.name
+            FROM comments
+            JOIN users ON comments.user_id = users.id
+            WHERE comments.post_id = ?
+            ORDER BY comments.created_at ASC
+        """, (post_id,))
+        return cursor.fetchall()
+
+# All comments for a set of posts in one query, oldest first
+@instrumented()
+@cached_read("comments", "users")
+def get_comments_for_posts(post_ids):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT comments.id, comments.post_id, comments.user_id, comments.content, comments.created_at,
+                   comments.parent_comment_id, users.name
+            FROM comments
+            JOIN users ON comments.user_id = users.id
+            WHERE comments.post_id IN ({get_backend().json_values("BIGINT")})
+            ORDER BY comments.created_at ASC, comments.id ASC
+        """, (json.dumps(list(post_ids)),))
+        return cursor.fetchall()
+
+# users rows for the given ids
+@instrumented()
+def get_users(user_ids):
+    with connection() as conn:
+        return conn.execute(f"SELECT * FROM users WHERE id IN ({get_backend().json_values('BIGINT')}) ORDER BY id",
+                            (json.dumps(list(user_ids)),)).fetchall()
+
@@ -0,0 +1,125 @@
+# Embedding index and near-duplicate clustering for free-text answers.
+#
+# Answers are embedded once with a hashed bag of words and word bigrams
+# (no model download, no GPU, no network) and stored as float16 BLOBs in
+# response_embeddings. Only rows above the highest embedded id are
+# processed on each update. Before summarisation the answers to each
+# question are grouped by cosine similarity, and only one representative
+# per group plus the group size is sent to the model.
+import json
+import re
+import zlib
+
+import numpy as np
+
+from dtl.db import connection, get_backend
+from dtl.questions import FREE_TEXT_TYPES, questions_of_type
+
+DIM = 256
+SIMILARITY_THRESHOLD = 0.5
+FREE_TEXT_KEYS = [key for key, _ in questions_of_type(*FREE_TEXT_TYPES)]
+
+_token_pattern = re.compile(r"[a-z0-9']+")
+
+def init_embeddings():
+    with connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS response_embeddings (
+                response_id INTEGER PRIMARY KEY,
+                vector BLOB,
+                FOREIGN KEY (response_id) REFERENCES answers (id)
+            )
+        """)
+
+# Hashed term-frequency vector, L2-normalised; None for blank answers
+def embed_text(text):
+    tokens = _token_pattern.findall(str(text).lower())
+    if not tokens:
+        return None
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vector = np.zeros(DIM, dtype=np.float32)
+    for feature in features:
+        bucket = zlib.crc32(feature.encode())
+        vector[bucket % DIM] += 1.0 if bucket & 0x80000000 else -1.0
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+# Embeds free-text responses added since the last update; returns how many were added
+def update_embeddings():
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT id, response FROM responses
+            WHERE id > (SELECT COALESCE(MAX(response_id), 0) FROM response_embeddings)
+              AND question IN ({get_backend().json_values("TEXT")})
+            ORDER BY id
+        """, (json.dumps(FREE_TEXT_KEYS),))
+        rows = []
+        for response_id, text in cursor.fetchall():
+            vector = embed_text(text) if text is not None else None
+            rows.append((response_id, None if vector is None else vector.astype(np.float16).tobytes()))
+        conn.executemany("""
+            INSERT INTO response_embeddings (response_id, vector) VALUES (?, ?)
+            ON CONFLICT (response_id) DO UPDATE SET vector = excluded.vector
+        """, rows)
+    return len(rows)
+
+# {response_id: vector} for the ids in [low, high]
+def load_vectors(low, high):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT response_id, vector FROM response_embeddings
+            WHERE response_id BETWEEN ? AND ? AND vector IS NOT NULL
+        """, (low, high))
+        return {response_id: np.frombuffer(vector, dtype=np.float16).astype(np.float32) for response_id, vector in cursor}
+
+# Greedy leader clustering: the first unassigned answer opens a cluster that
+# takes every unassigned answer within the similarity threshold. Costs one
+# matrix-vector product per cluster rather than a full similarity matrix.
+# Returns [(member indices, representative index)], largest cluster first.
+def cluster_vectors(matrix, threshold=SIMILARITY_THRESHOLD):
+    unassigned = np.arange(len(matrix))
+    clusters = []
+    while len(unassigned):
+        leader = unassigned[0]
+        similarities = matrix[unassigned] @ matrix[leader]
+        members = unassigned[similarities >= threshold]
+        unassigned = unassigned[similarities < threshold]
+        # The member closest to the cluster centroid represents it
+        centroid = matrix[members].mean(axis=0)
+        representative = members[np.argmax(matrix[members] @ centroid)]
+        clusters.append((members, representative))
+    clusters.sort(key=lambda cluster: -len(cluster[0]))
+    return clusters
+
+# The non-blank free-text answers among `responses` rows
+def free_text_answers(responses):
+    return [row for row in responses if row[2] in FREE_TEXT_KEYS and row[3] is not None and str(row[3]).strip()]
+
+# Free-text answers among `responses` rows grouped into near-duplicate
+# clusters: [(question key, representative answer, cluster size)]
+def cluster_free_text(responses, threshold=SIMILARITY_THRESHOLD):
+    free_text = free_text_answers(responses)
+    if not free_text:
+        return []
+    vectors = load_vectors(min(row[0] for row in free_text), max(row[0] for row in free_text))
+    by_question = {}
+    for row in free_text:
+        vector = vectors.get(row[0])
+        if vector is None:
+            vector = embed_text(row[3])
+        if vector is not None:
+            by_question.setdefault(row[2], ([], []))
+            by_question[row[2]][0].append(str(row[3]).strip())
+            by_question[row[2]][1].append(vector)
+
+    clusters = []
+    for key in FREE_TEXT_KEYS:
+        if key not in by_question:
+            continue
+        texts, question_vectors = by_question[key]
+        for members, representative in cluster_vectors(np.vstack(question_vectors), threshold):
+            clusters.append((key, texts[representative], len(members)))
+    return clusters
@@ -0,0 +1,247 @@
+# Chunked exports of users, responses, posts and comments.
+#
+# Tables are read CHUNK_SIZE rows at a time from a single streaming cursor
+# and each chunk is appended to the output file
+# before the next is read, so memory stays constant however large the
+# database is. Responses can also be exported wide, one row per respondent
+# and one column per question. In the app, exports run as background jobs
+# that write into EXPORT_DIR. Finished files are served by a small HTTP
+# server (start_export_server) that streams them from disk a block at a
+# time, so a download never passes through the Streamlit process; the
+# Download Data page only links to it. Set DTL_EXPORT_URL when the server
+# is reached through a proxy rather than on DTL_EXPORT_PORT of the app's host.
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+from dtl.db import connection, get_backend
+from dtl.jobs import enqueue, register
+from dtl.questions import question_keys
+
+EXPORT_JOB = "export"
+EXPORT_TABLES = ("users", "responses", "posts", "comments")
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_DIR = os.environ.get("DTL_EXPORT_DIR", os.path.join("static", "exports"))
+CHUNK_SIZE = 10000
+EXPORT_PORT = int(os.environ.get("DTL_EXPORT_PORT", "8502"))
+EXPORT_URL = os.environ.get("DTL_EXPORT_URL")  # public base URL of the export server, if proxied
+SEND_BLOCK = 1 << 20  # bytes per write when streaming a file
+
+def _check(table, fmt, wide):
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}', expected one of {', '.join(EXPORT_TABLES)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
+    if wide and table != "responses":
+        raise ValueError("Only responses can be exported in the wide layout")
+
+# (rows to export, highest id) of a table; identifies the snapshot an export covers
+def table_snapshot(table, wide=False):
+    _check(table, "csv", wide)
+    count = "COUNT(DISTINCT user_id)" if wide else "COUNT(*)"
+    with connection() as conn:
+        return conn.execute(f"SELECT {count}, COALESCE(MAX(id), 0) FROM {table}").fetchone()
+
+# "int", "float" or "text" for a declared SQL column type, following
+# SQLite's affinity rules (which also cover PostgreSQL's type names)
+def _kind(declared):
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return "int"
+    if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+        return "float"
+    return "text"
+
+# [(column, kind)] of an exported table, from its declared column types,
+# so every chunk gets the same types whatever values it happens to hold
+def export_columns(table, wide=False):
+    if wide:
+        return [("user_id", "int")] + [(key, "text") for key in question_keys]
+    with connection() as conn:
+        return [(column, _kind(declared)) for column, declared
+                in get_backend().column_types(conn.cursor(), table).items()]
+
+_PANDAS_TYPES = {"int": "Int64", "float": "Float64", "text": "string"}
+
+def _frame(rows, columns):
+    import pandas as pd
+    frame = pd.DataFrame.from_records(rows, columns=[column for column, _ in columns])
+    return frame.astype({column: _PANDAS_TYPES[kind] for column, kind in columns})
+
+# DataFrames of up to chunk_size rows of the result of `sql`, typed as
+# `columns`; the first one is yielded even when empty, so an empty table
+# still gets its header
+def _read_chunks(sql, columns, chunk_size):
+    with connection() as conn:
+        cursor = get_backend().stream_cursor(conn)
+        cursor.execute(sql)
+        batches = iter(lambda: cursor.fetchmany(chunk_size), [])
+        yield _frame(next(batches, []), columns)
+        for rows in batches:
+            yield _frame(rows, columns)
+
+# DataFrames of up to chunk_size rows of `table`, in id order
+def iter_chunks(table, chunk_size=CHUNK_SIZE):
+    columns = export_columns(table)
+    return _read_chunks(f"SELECT {', '.join(column for column, _ in columns)} FROM {table} ORDER BY id",
+                        columns, chunk_size)
+
+# Wide responses: DataFrames with user_id and one string column per
+# question. Chunks are cut at respondent boundaries; the last respondent of
+# a chunk may continue in the next one, so its rows are held back until
+# then. An empty table gives one empty frame, for the header.
+def iter_wide_chunks(chunk_size=CHUNK_SIZE):
+    import pandas as pd
+    columns = [("user_id", "int"), ("question", "text"), ("response", "text")]
+    carry = None
+    written = False
+    for chunk in _read_chunks("SELECT user_id, question, response FROM responses ORDER BY user_id, id",
+                              columns, chunk_size):
+        if chunk.empty:
+            continue
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        last_user = chunk["user_id"].iloc[-1]
+        carry = chunk[chunk["user_id"] == last_user]
+        chunk = chunk[chunk["user_id"] != last_user]
+        if not chunk.empty:
+            written = True
+            yield _pivot(chunk)
+    if carry is not None and not carry.empty:
+        yield _pivot(carry)
+    elif not written:
+        yield _frame([], export_columns("responses", wide=True))
+
+def _pivot(rows):
+    # Later answers to the same question win
+    wide = rows.pivot_table(index="user_id", columns="question", values="response", aggfunc="last")
+    wide = wide.reindex(columns=list(question_keys)).astype("string")
+    wide.columns.name = None
+    return wide.reset_index().astype({"user_id": "Int64"})
+
+def _write_chunks(chunks, path, fmt, columns, on_chunk=None):
+    rows = 0
+    with _parquet_writer(path, columns) if fmt == "parquet" else open(path, "wb") as out:
+        for chunk in chunks:
+            if fmt == "csv":
+                chunk.to_csv(out, header=rows == 0, index=False)
+            elif fmt == "jsonl":
+                if not chunk.empty:  # pandas writes a blank line for an empty frame
+                    chunk.to_json(out, orient="records", lines=True, force_ascii=False)
+            else:
+                _write_parquet(chunk, out)
+            rows += len(chunk)
+            if on_chunk:
+                on_chunk(rows)
+    return rows
+
+# Parquet writer whose schema comes from the declared column types, so an
+# empty export is still a valid file and a column that is all null in the
+# first chunk keeps its type for the later ones
+def _parquet_writer(path, columns):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    types = {"int": pa.int64(), "float": pa.float64(), "text": pa.string()}
+    return pq.ParquetWriter(path, pa.schema([(column, types[kind]) for column, kind in columns]))
+
+# Appends a chunk as one Parquet row group
+def _write_parquet(chunk, writer):
+    import pyarrow as pa
+    writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+
+# Exports `table` to `path` in `fmt`; returns the number of rows written.
+# The file is written under a temporary name and renamed when complete.
+def export_table(table, path, fmt="csv", wide=False, chunk_size=CHUNK_SIZE, on_chunk=None):
+    _check(table, fmt, wide)
+    chunks = iter_wide_chunks(chunk_size) if wide else iter_chunks(table, chunk_size)
+    partial = path + ".part"
+    try:
+        rows = _write_chunks(chunks, partial, fmt, export_columns(table, wide), on_chunk)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return rows
+
+def export_filename(table, fmt, wide, high_id):
+    return f"{table}{'_wide' if wide else ''}-{high_id}.{fmt}"
+
+def run_export_job(job, params):
+    table, fmt, wide = params["table"], params["format"], params["wide"]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    filename = export_filename(table, fmt, wide, params["high_id"])
+    total = max(params["rows"], 1)
+
+    def on_chunk(rows):
+        job.progress(min(rows / total, 0.99), f"Exported {rows} of {params['rows']} rows")
+
+    rows = export_table(table, os.path.join(EXPORT_DIR, filename), fmt, wide, on_chunk=on_chunk)
+    job.progress(1.0, f"Exported {rows} rows")
+    return filename
+
+register(EXPORT_JOB, run_export_job)
+
+# Job exporting the current contents of `table`; the same snapshot is only
+# exported again when its file has been removed from EXPORT_DIR
+def enqueue_export(table, fmt="csv", wide=False):
+    _check(table, fmt, wide)
+    rows, high_id = table_snapshot(table, wide)
+    exported = os.path.exists(os.path.join(EXPORT_DIR, export_filename(table, fmt, wide, high_id)))
+    return enqueue(EXPORT_JOB, f"{table}:{fmt}:{int(wide)}:{rows}:{high_id}", {
+        "table": table,
+        "format": fmt,
+        "wide": wide,
+        "rows": rows,
+        "high_id": high_id,
+    }, reuse_done=exported)
+
+
+class ExportHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    # GET /<filename> streams that file from EXPORT_DIR; nothing outside it is served
+    def do_GET(self):
+        filename = unquote(urlsplit(self.path).path.lstrip("/"))
+        path = os.path.join(EXPORT_DIR, filename)
+        if not filename or os.path.basename(filename) != filename or filename.startswith(".") \
+                or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}")
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, SEND_BLOCK)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+# Serves EXPORT_DIR on `port` (default DTL_EXPORT_PORT) once per process;
+# returns the server
+def start_export_server(port=None, host="0.0.0.0"):
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, EXPORT_PORT if port is None else int(port)), ExportHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="export-server", daemon=True).start()
+        return _server
+
+# Link to a finished export for a page served from `host` (the request's
+# Host header): DTL_EXPORT_URL when set, else the export port on that host
+def export_url(filename, host=None):
+    base = EXPORT_URL
+    if not base:
+        hostname = urlsplit("//" + (host or "localhost")).hostname
+        base = f"http://{f'[{hostname}]' if ':' in hostname else hostname}:{EXPORT_PORT}"
+    return f"{base.rstrip('/')}/{quote(filename)}"
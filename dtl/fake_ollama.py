@@ -0,0 +1,104 @@
+# Local stand-in for Ollama's /api/generate, for exercising the LLM client
+# without a model server: python -m dtl.fake_ollama --port 11434
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # Clients closing idle keep-alive connections is normal, not an error
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        model = body.get("model", "llama3.1")
+        words = server.reply.split() if server.reply else body.get("prompt", "").split()[:server.max_words]
+        num_predict = body.get("options", {}).get("num_predict")
+        if num_predict is not None and num_predict >= 0:
+            words = words[:num_predict]
+        tokens = [word + " " for word in words] or ["ok"]
+        started = time.perf_counter_ns()
+
+        if not body.get("stream", True):
+            time.sleep(server.delay * len(tokens))
+            self._send_json({"model": model, "response": "".join(tokens), "done": True,
+                             "eval_count": len(tokens), "eval_duration": time.perf_counter_ns() - started})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(server.delay)
+                self._send_chunk({"model": model, "response": token, "done": False})
+            self._send_chunk({"model": model, "response": "", "done": True, "done_reason": "stop",
+                              "prompt_eval_count": len(body.get("prompt", "").split()),
+                              "eval_count": len(tokens), "eval_duration": time.perf_counter_ns() - started})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_json(self, data):
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_chunk(self, data):
+        line = json.dumps(data).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+# Starts the stand-in server on a background thread; port 0 picks a free port
+def start_server(host="127.0.0.1", port=0, delay=0.0, reply=None, max_words=50):
+    server = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.reply = reply
+    server.max_words = max_words
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Ollama server that streams NDJSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--delay", type=float, default=0.02, help="seconds per streamed token")
+    parser.add_argument("--reply", default=None, help="fixed reply text (default: echo the prompt)")
+    args = parser.parse_args()
+    server = start_server(args.host, args.port, args.delay, args.reply)
+    print(f"Fake Ollama listening on http://{args.host}:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
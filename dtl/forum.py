@@ -0,0 +1,20 @@
+# Thread building for the Forum page. Comments for every visible post are
+# indexed once by (post_id, parent_comment_id), so rendering a thread only
+# ever visits each comment's own children.
+
+# {post_id: {parent_comment_id: [comment, ...]}} in one pass over the rows
+def build_comment_index(comments):
+    index = {}
+    for comment in comments:
+        post_id, parent_id = comment[1], comment[5]
+        index.setdefault(post_id, {}).setdefault(parent_id, []).append(comment)
+    return index
+
+# Pre-order walk of one post's thread yielding (comment, level); iterative so
+# arbitrarily deep reply chains cannot hit the recursion limit
+def walk_thread(children, parent_id=None):
+    stack = [(comment, 0) for comment in reversed(children.get(parent_id, []))]
+    while stack:
+        comment, level = stack.pop()
+        yield comment, level
+        stack.extend((child, level + 1) for child in reversed(children.get(comment[0], [])))
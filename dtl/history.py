@@ -0,0 +1,85 @@
+# History of generated regulations with the responses high-water mark
+# (the largest responses.id folded in) each one was built from, so the
+# next run only has to read and summarise rows above it.
+from dtl.db import connection
+from dtl.metrics import instrumented
+
+def init_history():
+    with connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS regulations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model TEXT,
+                regulations TEXT,
+                high_water_mark INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+def max_response_id():
+    with connection() as conn:
+        # On the table rather than the responses view, so it is one index seek
+        return conn.execute("SELECT MAX(id) FROM answers").fetchone()[0]
+
+# Parameters and WHERE clause for answers with high_water_mark < id <= until
+# (no upper bound when until is None)
+def _since(high_water_mark, until):
+    if until is None:
+        return (high_water_mark,), "WHERE answers.id > ?"
+    return (high_water_mark, until), "WHERE answers.id > ? AND answers.id <= ?"
+
+# Free-text responses with high_water_mark < id <= until, as responses
+# rows; all that clustering and the token budget read
+@instrumented()
+def fetch_free_text_since(high_water_mark, until=None):
+    bounds, where = _since(high_water_mark, until)
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT answers.id, answers.user_id, survey_questions.key, answers.response
+            FROM answers
+            JOIN survey_questions ON survey_questions.id = answers.question_id
+            {where} AND answers.response IS NOT NULL
+            ORDER BY answers.id
+        """, bounds)
+        return cursor.fetchall()
+
+# Closed-ended answers with high_water_mark < id <= until, counted in SQL:
+# (question, option label, slider value, count) rows, and the number of
+# respondents who answered anything in that range
+@instrumented(rows=lambda result: len(result[0]))
+def count_answers_since(high_water_mark, until=None):
+    bounds, where = _since(high_water_mark, until)
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT survey_questions.key, survey_options.label, answers.value, COUNT(*)
+            FROM answers
+            JOIN survey_questions ON survey_questions.id = answers.question_id
+            LEFT JOIN survey_options ON survey_options.question_id = answers.question_id
+                                    AND survey_options.option_id = answers.option_id
+            {where} AND (answers.option_id IS NOT NULL OR answers.value IS NOT NULL)
+            GROUP BY survey_questions.key, survey_options.label, answers.value
+        """, bounds)
+        counts = cursor.fetchall()
+        cursor.execute(f"SELECT COUNT(DISTINCT user_id) FROM answers {where}", bounds)
+        return counts, cursor.fetchone()[0]
+
+# Most recent regulation for a model, as (regulations, high_water_mark)
+@instrumented()
+def latest_regulation(model):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT regulations, high_water_mark FROM regulations
+            WHERE model = ?
+            ORDER BY high_water_mark DESC, id DESC
+            LIMIT 1
+        """, (model,))
+        return cursor.fetchone()
+
+@instrumented()
+def save_regulation(model, regulations, high_water_mark):
+    with connection() as conn:
+        conn.execute("INSERT INTO regulations (model, regulations, high_water_mark) VALUES (?, ?, ?)",
+                     (model, regulations, high_water_mark))
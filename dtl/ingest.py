@@ -0,0 +1,184 @@
+# Bulk loading of respondents from files, e.g. paper or partner-site surveys.
+#
+# JSONL files have one respondent per line:
+#
+#   {"name": "...", "age": 30, "gender": "Female", "knows_autonomous": "Yes",
+#    "responses": {"Q1": "...", "Q2": 50, ...}}
+#
+# CSV files have one respondent per row, with name, age, gender and
+# knows_autonomous columns followed by one column per answered question
+# (Q1, Q2, ...); empty cells are unanswered questions. The wide responses
+# export has this layout, plus the user columns.
+#
+# Every record is checked against the question schema; invalid ones are
+# skipped and reported. Valid records are written BATCH_SIZE respondents
+# per transaction with executemany, and user ids are assigned up front so
+# users and their answers go in as a few statements per batch. The answers
+# index and the per-row full-text, read-cache version and regulation cache
+# triggers are dropped for the load and rebuilt once at the end, so run
+# bulk loads while the app is idle. A server database keeps its indexes
+# and triggers (its version triggers bump once per transaction), so loads
+# there can run alongside the app.
+import csv
+import datetime
+import json
+import os
+import time
+
+from dtl.cache import init_cache
+from dtl.db import connection, get_backend, init_db, insert_answers
+from dtl.questions import (CHOICE_TYPES, FREE_TEXT_TYPES, GENDER_OPTIONS, KNOWS_AUTONOMOUS_OPTIONS, SLIDER_TYPES,
+                           question_keys, questions)
+from dtl.search import init_search
+
+BATCH_SIZE = 20000  # respondents per transaction
+USER_FIELDS = ("name", "age", "gender", "knows_autonomous")
+INGEST_FORMATS = ("csv", "jsonl")
+MAX_REPORTED_ERRORS = 20
+
+_schema = dict(zip(question_keys, questions))
+_deferred_triggers = ("responses_fts_ai", "responses_fts_ad", "responses_fts_au", "users_version_ai",
+                      "answers_version_ai", "regulation_cache_invalidate")
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+def read_csv(f):
+    for row in csv.DictReader(f):
+        yield {
+            **{field: row.get(field) for field in USER_FIELDS},
+            "responses": {key: row[key] for key in question_keys if row.get(key) not in (None, "")},
+        }
+
+def read_records(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in INGEST_FORMATS:
+        raise ValueError(f"Unknown input format '{fmt}', expected one of {', '.join(INGEST_FORMATS)}")
+    with open(path, encoding="utf-8", newline="") as f:
+        yield from (read_csv(f) if fmt == "csv" else read_jsonl(f))
+
+def _validate_answer(key, answer):
+    item = _schema.get(key)
+    if item is None:
+        raise InvalidRecord(f"unknown question {key}")
+    input_type = item["input_type"]
+    if input_type in CHOICE_TYPES:
+        if answer not in item["options"]:
+            raise InvalidRecord(f"{key}: {answer!r} is not one of the options")
+        return answer
+    if input_type in SLIDER_TYPES:
+        try:
+            value = int(answer)
+        except (TypeError, ValueError):
+            raise InvalidRecord(f"{key}: {answer!r} is not a number")
+        if not item["min"] <= value <= item["max"] or (value - item["min"]) % item["step"]:
+            raise InvalidRecord(f"{key}: {value} is off the {item['min']}-{item['max']} scale")
+        return value
+    if input_type in FREE_TEXT_TYPES:
+        return str(answer)
+    raise InvalidRecord(f"{key}: unknown input type {input_type}")
+
+# (user fields tuple, [(question, answer)]) for a valid record; raises InvalidRecord
+def validate_record(record):
+    name = str(record.get("name") or "").strip()
+    if not name:
+        raise InvalidRecord("name is empty")
+    try:
+        age = int(record.get("age"))
+    except (TypeError, ValueError):
+        raise InvalidRecord(f"age {record.get('age')!r} is not a number")
+    if not 0 <= age <= 120:
+        raise InvalidRecord(f"age {age} is out of range")
+    if record.get("gender") not in GENDER_OPTIONS:
+        raise InvalidRecord(f"gender {record.get('gender')!r} is not one of {', '.join(GENDER_OPTIONS)}")
+    if record.get("knows_autonomous") not in KNOWS_AUTONOMOUS_OPTIONS:
+        raise InvalidRecord(f"knows_autonomous {record.get('knows_autonomous')!r} is not Yes or No")
+    answers = [(key, _validate_answer(key, answer)) for key, answer in (record.get("responses") or {}).items()
+               if answer is not None]
+    return (name, age, record["gender"], record["knows_autonomous"]), answers
+
+def _defer_indexes(cursor):
+    cursor.execute("DROP INDEX IF EXISTS idx_answers_user")
+    for trigger in _deferred_triggers:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+# Indexes the free text loaded after `low_id`, invalidates cached reads and
+# regulations and recreates the dropped index and triggers
+def _restore_indexes(low_id):
+    init_cache()
+    with connection() as conn:
+        conn.execute("""
+            INSERT INTO responses_fts (rowid, response)
+            SELECT id, response FROM answers WHERE id > ? AND response IS NOT NULL
+        """, (low_id,))
+        # One version bump and cache flush for the whole load instead of one per row
+        conn.execute("UPDATE data_version SET version = version + 1 WHERE name IN ('users', 'responses')")
+        conn.execute("DELETE FROM regulation_cache")
+    init_db()
+    init_search()
+
+def _insert_batch(cursor, batch, timestamp):
+    user_ids = get_backend().next_ids(cursor, "users", len(batch))
+    cursor.executemany("""
+        INSERT INTO users (id, name, age, gender, knows_autonomous, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(user_id, *user, timestamp) for user_id, (user, _) in zip(user_ids, batch)])
+    rows = [(user_id, question, answer)
+            for user_id, (_, answers) in zip(user_ids, batch) for question, answer in answers]
+    return insert_answers(cursor, rows)
+
+# Loads `records` (dicts as produced by read_records). With strict=True the
+# first invalid record aborts the load; batches already committed stay.
+# on_progress(stats) is called after every batch. Returns stats: counts of
+# respondents, responses and rejected records, the first few errors, and
+# the elapsed seconds.
+def ingest_records(records, batch_size=BATCH_SIZE, strict=False, on_progress=None):
+    stats = {"respondents": 0, "responses": 0, "rejected": 0, "errors": [], "seconds": 0.0}
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    started = time.perf_counter()
+    deferred = get_backend().dialect == "sqlite"
+    if deferred:
+        with connection() as conn:
+            low_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM answers").fetchone()[0]
+            _defer_indexes(conn.cursor())
+    try:
+        batch = []
+        for number, record in enumerate(records, 1):
+            try:
+                batch.append(validate_record(record))
+            except InvalidRecord as e:
+                if strict:
+                    raise InvalidRecord(f"record {number}: {e}")
+                stats["rejected"] += 1
+                if len(stats["errors"]) < MAX_REPORTED_ERRORS:
+                    stats["errors"].append(f"record {number}: {e}")
+            if len(batch) >= batch_size:
+                _commit_batch(batch, timestamp, stats, started, on_progress)
+                batch = []
+        if batch:
+            _commit_batch(batch, timestamp, stats, started, on_progress)
+    finally:
+        if deferred:
+            _restore_indexes(low_id)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def _commit_batch(batch, timestamp, stats, started, on_progress):
+    with connection() as conn:
+        if get_backend().dialect == "sqlite":
+            conn.execute("BEGIN IMMEDIATE")  # holds the write lock while user ids are assigned
+        stats["responses"] += _insert_batch(conn.cursor(), batch, timestamp)
+    stats["respondents"] += len(batch)
+    stats["seconds"] = time.perf_counter() - started
+    if on_progress:
+        on_progress(stats)
+
+def ingest_file(path, fmt=None, batch_size=BATCH_SIZE, strict=False, on_progress=None):
+    return ingest_records(read_records(path, fmt), batch_size, strict, on_progress)
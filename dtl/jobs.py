@@ -0,0 +1,276 @@
+# Persistent background job queue.
+#
+# Jobs live in a database table so they survive Streamlit reruns, page
+# navigation and restarts. Each process runs a small pool of worker
+# threads that claim queued jobs atomically, so several app processes can
+# share one queue. A partial unique index allows only one queued or running
+# job per (kind, snapshot_key): enqueueing the same input snapshot again
+# returns the existing job instead of starting a second generation.
+import json
+import threading
+import time
+import traceback
+
+from dtl.db import connection
+
+WORKERS = 2
+POLL_INTERVAL = 0.5
+HEARTBEAT_INTERVAL = 30
+STALE_SECONDS = 120  # running jobs without a heartbeat for this long are requeued
+REQUEUE_INTERVAL = 30  # seconds between checks for stale jobs in each process
+ACTIVE_STATUSES = ("queued", "running")
+
+_handlers = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class HeartbeatLost(Exception):
+    pass
+
+
+def init_jobs():
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT,
+                snapshot_key TEXT,
+                params TEXT,
+                status TEXT,
+                progress REAL DEFAULT 0,
+                message TEXT,
+                partial TEXT,
+                result TEXT,
+                error TEXT,
+                cancel_requested INTEGER DEFAULT 0,
+                created_at REAL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL
+            )
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active ON jobs (kind, snapshot_key)
+            WHERE status IN ('queued', 'running')
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+
+# Handler signature: handler(job, params) -> result text
+def register(kind, handler):
+    _handlers[kind] = handler
+
+# Queue a job unless the same snapshot is already queued, running or (with
+# reuse_done) done; returns the id of the job that will (or did) produce
+# the result
+def enqueue(kind, snapshot_key, params=None, reuse_done=True):
+    statuses = ("queued", "running", "done") if reuse_done else ACTIVE_STATUSES
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT id FROM jobs
+            WHERE kind = ? AND snapshot_key = ? AND status IN ({', '.join('?' * len(statuses))})
+            ORDER BY id DESC LIMIT 1
+        """, (kind, snapshot_key, *statuses))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        cursor.execute("""
+            INSERT INTO jobs (kind, snapshot_key, params, status, created_at)
+            VALUES (?, ?, ?, 'queued', ?)
+            ON CONFLICT DO NOTHING
+            RETURNING id
+        """, (kind, snapshot_key, json.dumps(params or {}), time.time()))
+        inserted = cursor.fetchone()
+        if inserted:
+            return inserted[0]
+        # Lost the race against another session enqueueing the same snapshot
+        cursor.execute("""
+            SELECT id FROM jobs WHERE kind = ? AND snapshot_key = ? AND status IN ('queued', 'running')
+        """, (kind, snapshot_key))
+        return cursor.fetchone()[0]
+
+# Job row as a dict, or None
+def get_job(job_id):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, kind, snapshot_key, status, progress, message, partial, result, error,
+                   created_at, started_at, finished_at
+            FROM jobs WHERE id = ?
+        """, (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+def cancel_job(job_id):
+    with connection() as conn:
+        conn.execute("""
+            UPDATE jobs SET status = 'cancelled', finished_at = ?
+            WHERE id = ? AND status = 'queued'
+        """, (time.time(), job_id))
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+
+
+# Handle given to a running handler for reporting progress and checking cancellation
+class Job:
+    def __init__(self, job_id, heartbeat_lost=None):
+        self.id = job_id
+        self.heartbeat_lost = heartbeat_lost or threading.Event()
+
+    def progress(self, fraction, message=None, partial=None):
+        self._check_heartbeat()
+        with connection() as conn:
+            cancel_requested = conn.execute("""
+                UPDATE jobs SET progress = ?, message = COALESCE(?, message), partial = COALESCE(?, partial),
+                                heartbeat_at = ?
+                WHERE id = ?
+                RETURNING cancel_requested
+            """, (fraction, message, partial, time.time(), self.id)).fetchall()
+        if cancel_requested and cancel_requested[0][0]:
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        self._check_heartbeat()
+        with connection() as conn:
+            cancel_requested = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()
+        if cancel_requested and cancel_requested[0]:
+            raise JobCancelled()
+
+    # Stops the handler once its heartbeat could not be written, since the
+    # job may then be requeued and picked up by another worker
+    def _check_heartbeat(self):
+        if self.heartbeat_lost.is_set():
+            raise HeartbeatLost("The job's heartbeat could not be recorded")
+
+
+# The status check in the outer WHERE makes a worker that raced another
+# one for the same job (possible on a server database) claim nothing
+def _claim():
+    now = time.time()
+    with connection() as conn:
+        claimed = conn.execute("""
+            UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?
+            WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1) AND status = 'queued'
+            RETURNING id, kind, params
+        """, (now, now)).fetchall()
+    return claimed[0] if claimed else None
+
+def _finish(job_id, status, result=None, error=None):
+    with connection() as conn:
+        conn.execute("""
+            UPDATE jobs SET status = ?, result = ?, error = ?, progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END,
+                            finished_at = ?
+            WHERE id = ?
+        """, (status, result, error, status, time.time(), job_id))
+
+# Jobs left running by a process that died are put back in the queue,
+# unless they were asked to stop, in which case they are cancelled. Every
+# worker pool checks for them every REQUEUE_INTERVAL, so a job stranded by
+# a restart is picked up once its heartbeat expires, not only when a pool
+# happens to start after that.
+def requeue_stale_jobs():
+    now = time.time()
+    with connection() as conn:
+        conn.execute("""
+            UPDATE jobs SET status = CASE WHEN cancel_requested = 1 THEN 'cancelled' ELSE 'queued' END,
+                            finished_at = CASE WHEN cancel_requested = 1 THEN ? ELSE finished_at END
+            WHERE status = 'running' AND heartbeat_at < ?
+        """, (now, now - STALE_SECONDS))
+
+# A heartbeat that cannot be written ends the loop and sets `lost`: the
+# job would otherwise look stale and be run a second time elsewhere
+def _beat(job_id, done, lost):
+    while not done.wait(HEARTBEAT_INTERVAL):
+        try:
+            with connection() as conn:
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+        except Exception:
+            traceback.print_exc()
+            lost.set()
+            return
+
+def run_job(job_id, kind, params):
+    handler = _handlers.get(kind)
+    if handler is None:
+        _finish(job_id, "failed", error=f"No handler registered for job kind '{kind}'")
+        return
+    # Keeps the heartbeat fresh while the handler is busy in a long LLM call
+    done, lost = threading.Event(), threading.Event()
+    heartbeat = threading.Thread(target=_beat, args=(job_id, done, lost), daemon=True)
+    heartbeat.start()
+    try:
+        result = handler(Job(job_id, lost), json.loads(params))
+        if lost.is_set():
+            raise HeartbeatLost("The job's heartbeat could not be recorded")
+    except JobCancelled:
+        _finish(job_id, "cancelled")
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job_id, "failed", error=str(e))
+    else:
+        _finish(job_id, "done", result=result)
+    finally:
+        done.set()
+
+
+class WorkerPool:
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._stop = threading.Event()
+        self._threads = []
+        self._next_requeue = 0.0
+        self._requeue_lock = threading.Lock()
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # One worker thread at a time runs the stale-job check when it is due
+    def _requeue_if_due(self):
+        with self._requeue_lock:
+            now = time.monotonic()
+            if now < self._next_requeue:
+                return
+            self._next_requeue = now + REQUEUE_INTERVAL
+        requeue_stale_jobs()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._requeue_if_due()
+                claimed = _claim()
+            except Exception:
+                traceback.print_exc()
+                claimed = None
+            if claimed is None:
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            run_job(*claimed)
+
+    # Workers finish the job they are running first; with `wait` this
+    # returns only once they have
+    def stop(self, wait=False):
+        self._stop.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Starts this process's worker threads once; later calls are no-ops
+def start_workers(workers=WORKERS):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(workers)
+            _pool.start()
+        return _pool
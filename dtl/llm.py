@@ -0,0 +1,231 @@
+# Shared client for the local Ollama server.
+#
+# One keep-alive session and one bounded worker pool per process, so any
+# number of Streamlit sessions hitting "Generate" share at most
+# MAX_CONCURRENCY upstream requests. Identical prompts that are already in
+# flight are coalesced into a single upstream call, and connection errors
+# and 5xx/429 answers are retried with exponential backoff.
+#
+# Prompt sizes are estimated in tokens from their length, at a
+# characters-per-token ratio calibrated per model from the prompt token
+# counts the server reports with every generation.
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from dtl.metrics import record
+
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434")
+DEFAULT_MODEL = "llama3.1"
+MAX_CONCURRENCY = 4
+TIMEOUT = (5, 300)  # (connect, read between chunks) in seconds
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CONTEXT_TOKENS = 8192  # num_ctx: prompt and output together
+OUTPUT_TOKENS = 512  # num_predict: longest answer per call
+CHARS_PER_TOKEN = 4.0  # until the server has reported a prompt's token count
+CALIBRATION_WEIGHT = 0.2  # weight of each new observation in the running ratio
+# Ollama only reads these from the request's "options" object and ignores
+# them at the top level; max_tokens is the OpenAI name for num_predict
+MODEL_OPTIONS = ("num_ctx", "num_predict", "temperature", "top_k", "top_p", "seed", "stop", "repeat_penalty")
+OPTION_ALIASES = {"max_tokens": "num_predict"}
+
+_chars_per_token = {}
+_calibration_lock = threading.Lock()
+
+# Folds a prompt's length and the token count the server reported for it
+# into the model's characters-per-token ratio
+def observe_prompt(model, chars, tokens):
+    if not chars or not tokens:
+        return
+    ratio = chars / tokens
+    if not 1.0 <= ratio <= 8.0:  # e.g. a prompt mostly served from the server's cache
+        return
+    with _calibration_lock:
+        current = _chars_per_token.get(model)
+        _chars_per_token[model] = ratio if current is None else current + CALIBRATION_WEIGHT * (ratio - current)
+
+def chars_per_token(model=None):
+    return _chars_per_token.get(model or DEFAULT_MODEL, CHARS_PER_TOKEN)
+
+# Estimated prompt tokens of `text` for `model`, rounded up
+def estimate_tokens(text, model=None):
+    return math.ceil(len(text) / chars_per_token(model))
+
+
+# Timing of one streamed generation: time to first token and decode rate
+class StreamStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.tokens = 0
+        self.prompt_tokens = None
+        self.eval_duration = None
+
+    def record(self, chunk):
+        now = time.perf_counter()
+        if chunk.get("response"):
+            if self.first_token_at is None:
+                self.first_token_at = now
+            self.tokens += 1
+        if chunk.get("done"):
+            self.finished_at = now
+            self.tokens = chunk.get("eval_count", self.tokens)
+            self.prompt_tokens = chunk.get("prompt_eval_count")
+            if chunk.get("eval_duration"):
+                self.eval_duration = chunk["eval_duration"] / 1e9
+
+    @property
+    def time_to_first_token(self):
+        return None if self.first_token_at is None else self.first_token_at - self.started
+
+    @property
+    def tokens_per_second(self):
+        # Prefer the server's own decode timing; fall back to wall clock since the first token
+        duration = self.eval_duration
+        if not duration and self.first_token_at is not None:
+            duration = (self.finished_at or time.perf_counter()) - self.first_token_at
+        return self.tokens / duration if duration else 0.0
+
+
+class LLMClient:
+    def __init__(self, base_url=OLLAMA_URL, model=DEFAULT_MODEL, max_concurrency=MAX_CONCURRENCY,
+                 timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+        self.endpoint = base_url.rstrip("/") + "/api/generate"
+        self.model = model
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # requests is imported on first use so importing dtl stays cheap for scripts and workers
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    # Request body; model options given as keyword arguments (or by their
+    # OpenAI names) are moved into "options", where Ollama looks for them
+    def _payload(self, prompt, params):
+        payload = {"model": self.model, "prompt": prompt}
+        options = dict(params.pop("options", None) or {})
+        for name, value in params.items():
+            name = OPTION_ALIASES.get(name, name)
+            if name in MODEL_OPTIONS:
+                options[name] = value
+            else:
+                payload[name] = value
+        if options:
+            payload["options"] = options
+        payload["stream"] = True
+        return payload
+
+    # POST with retry; returns an open streaming response with a 2xx status
+    def _post(self, payload):
+        import requests
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.endpoint, json=payload, stream=True, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                response.close()
+                if attempt >= self.retries:
+                    response.raise_for_status()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.retries:
+                    raise
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def _stream(self, payload):
+        import requests
+        stats = StreamStats()
+        try:
+            with self._slots:
+                response = self._post(payload)
+                try:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if "error" in chunk:
+                            raise requests.exceptions.HTTPError(chunk["error"], response=response)
+                        stats.record(chunk)
+                        yield chunk
+                        if chunk.get("done"):
+                            break
+                finally:
+                    # Returns the connection to the pool even if the caller stops early
+                    response.close()
+        finally:
+            observe_prompt(payload["model"], len(payload["prompt"]), stats.prompt_tokens)
+            record("llm.generate", time.perf_counter() - stats.started, prompt_chars=len(payload["prompt"]),
+                   prompt_tokens=stats.prompt_tokens, ttft_s=stats.time_to_first_token, tokens=stats.tokens,
+                   tokens_per_s=stats.tokens_per_second)
+
+    # Yields the raw NDJSON chunks of one generation
+    def stream(self, prompt, **params):
+        return self._stream(self._payload(prompt, params))
+
+    # Yields the generated text fragment by fragment, recording timings into stats.
+    # Closing the generator early closes the HTTP response and frees its slot.
+    def stream_text(self, prompt, stats=None, **params):
+        with closing(self.stream(prompt, **params)) as chunks:
+            for chunk in chunks:
+                if stats is not None:
+                    stats.record(chunk)
+                if chunk.get("response"):
+                    yield chunk["response"]
+
+    def _generate(self, payload):
+        return "".join(chunk.get("response", "") for chunk in self._stream(payload))
+
+    # Returns a Future for the generated text; identical in-flight requests share one Future
+    def submit(self, prompt, **params):
+        payload = self._payload(prompt, params)
+        key = json.dumps(payload, sort_keys=True)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._generate, payload)
+            self._inflight[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def generate(self, prompt, **params):
+        return self.submit(prompt, **params).result()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+# Process-wide client shared by every Streamlit session
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
@@ -0,0 +1,172 @@
+# In-process latency and size metrics for the DB and LLM hot paths.
+#
+# Every instrumented call appends one sample (duration plus a few numeric
+# fields such as rows returned or tokens generated) to a fixed-size ring
+# buffer per metric name, so recording costs a deque append and memory
+# stays bounded. The Metrics page summarises the buffers as percentiles,
+# and when DTL_METRICS_PORT is set the same summary is served in the
+# Prometheus text format at /metrics.
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RING_SIZE = 2048  # samples kept per metric
+QUANTILES = (0.5, 0.9, 0.99)
+METRICS_PORT = os.environ.get("DTL_METRICS_PORT")
+
+_samples = {}
+_totals = {}  # name -> [count, sum of seconds] since start, for Prometheus counters
+_lock = threading.Lock()
+
+def record(name, seconds, **fields):
+    with _lock:
+        ring = _samples.get(name)
+        if ring is None:
+            ring = _samples[name] = deque(maxlen=RING_SIZE)
+            _totals[name] = [0, 0.0]
+        ring.append((time.time(), seconds, fields))
+        _totals[name][0] += 1
+        _totals[name][1] += seconds
+
+# Times the block; fields set on the yielded dict are recorded with it
+@contextmanager
+def measure(name, **fields):
+    started = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record(name, time.perf_counter() - started, **fields)
+
+def _rows(result):
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    return None
+
+# Decorator recording each call's duration and, for list/dict results, the
+# rows returned; pass `rows` to count them differently (e.g. for a tuple of
+# result sets). Generator functions are timed until they are exhausted or
+# closed, counting the items they yield.
+def instrumented(name=None, rows=_rows):
+    def decorate(fn):
+        metric = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator(*args, **kwargs):
+                with measure(metric) as fields:
+                    fields["rows"] = 0
+                    for item in fn(*args, **kwargs):
+                        fields["rows"] += 1
+                        yield item
+            return generator
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with measure(metric) as fields:
+                result = fn(*args, **kwargs)
+                count = rows(result)
+                if count is not None:
+                    fields["rows"] = count
+                return result
+        return wrapper
+    return decorate
+
+def _quantile(values, q):
+    # Nearest-rank percentile over a sorted list
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+# One dict per metric: sample count, duration percentiles in milliseconds
+# and, for every numeric field, its percentiles too
+def summary():
+    with _lock:
+        snapshot = {name: list(ring) for name, ring in _samples.items()}
+        totals = {name: tuple(total) for name, total in _totals.items()}
+    rows = []
+    for name in sorted(snapshot):
+        samples = snapshot[name]
+        durations = sorted(seconds for _, seconds, _ in samples)
+        row = {"metric": name, "calls": totals[name][0], "samples": len(samples)}
+        for q in QUANTILES:
+            row[f"p{int(q * 100)}_ms"] = _quantile(durations, q) * 1000
+        row["max_ms"] = durations[-1] * 1000
+        fields = sorted({field for _, _, values in samples for field in values})
+        for field in fields:
+            values = sorted(values[field] for _, _, values in samples if values.get(field) is not None)
+            if values:
+                row[f"{field}_p50"] = _quantile(values, 0.5)
+                row[f"{field}_p99"] = _quantile(values, 0.99)
+        rows.append(row)
+    return rows
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+# The recorded metrics in the Prometheus text exposition format: a summary
+# of call latency per metric plus a gauge per field percentile
+def prometheus_text():
+    with _lock:
+        snapshot = {name: list(ring) for name, ring in _samples.items()}
+        totals = {name: tuple(total) for name, total in _totals.items()}
+    lines = ["# HELP dtl_call_seconds Latency of instrumented calls (quantiles over the recent samples)",
+             "# TYPE dtl_call_seconds summary"]
+    for name in sorted(snapshot):
+        durations = sorted(seconds for _, seconds, _ in snapshot[name])
+        for q in QUANTILES:
+            lines.append(f'dtl_call_seconds{{metric="{_label(name)}",quantile="{q}"}} {_quantile(durations, q):.6f}')
+        lines.append(f'dtl_call_seconds_count{{metric="{_label(name)}"}} {totals[name][0]}')
+        lines.append(f'dtl_call_seconds_sum{{metric="{_label(name)}"}} {totals[name][1]:.6f}')
+    lines += ["# HELP dtl_call_field Numeric fields of instrumented calls (rows, tokens, ...) by quantile",
+              "# TYPE dtl_call_field gauge"]
+    for name in sorted(snapshot):
+        fields = sorted({field for _, _, values in snapshot[name] for field in values})
+        for field in fields:
+            values = sorted(values[field] for _, _, values in snapshot[name] if values.get(field) is not None)
+            for q in QUANTILES:
+                if values:
+                    lines.append(f'dtl_call_field{{metric="{_label(name)}",field="{_label(field)}",quantile="{q}"}} '
+                                 f"{_quantile(values, q):g}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+# Serves /metrics on `port` (default DTL_METRICS_PORT) once per process;
+# returns the server, or None when no port is configured
+def start_metrics_server(port=None, host="0.0.0.0"):
+    global _server
+    port = port if port is not None else METRICS_PORT
+    if port is None:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
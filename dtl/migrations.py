@@ -0,0 +1,94 @@
+# Schema migrations. Each one runs once per database, in order, and the
+# last one applied is recorded in PRAGMA user_version. init_db applies the
+# pending ones in a single write transaction, so a second process starting
+# at the same time waits and then finds nothing left to do.
+from dtl.answers import create_answer_tables, store_answers
+
+COPY_SIZE = 10000  # rows per batch when copying a table
+
+# 1: the responses table becomes the answers table behind a responses
+# view (see dtl.answers). Ids are kept, so history high-water
+# marks, embeddings and the regulation cache stay valid.
+def _normalize_responses(cursor):
+    if not cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'responses'").fetchone():
+        return
+    sequence = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'responses'").fetchone()
+    # The version, cache and search triggers are recreated on the new tables by init_*
+    triggers = cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'responses'")
+    for (trigger,) in triggers.fetchall():
+        cursor.execute(f"DROP TRIGGER {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS responses_fts")  # rebuilt over answers by init_search
+    cursor.execute("ALTER TABLE responses RENAME TO legacy_responses")
+    create_answer_tables(cursor)
+    reader = cursor.connection.cursor()
+    reader.execute("SELECT id, user_id, question, response FROM legacy_responses ORDER BY id")
+    for rows in iter(lambda: reader.fetchmany(COPY_SIZE), []):
+        store_answers(cursor, rows)
+    if sequence:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'answers'", sequence)
+        if not cursor.rowcount:
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('answers', ?)", sequence)
+    cursor.execute("DROP TABLE legacy_responses")
+
+# 2: the responses view joins labels and free text instead of looking them
+# up per row, and response_embeddings, which declared its key as
+# referencing the view, is dropped to be recreated by init_embeddings
+# against answers and refilled on the next generation.
+def _join_responses_view(cursor):
+    cursor.execute("DROP VIEW IF EXISTS responses")
+    cursor.execute("DROP TABLE IF EXISTS response_embeddings")
+    create_answer_tables(cursor)
+
+# 3: free text moves from answer_text into answers.response, so a free-text
+# answer is one row instead of two and the responses view reads every
+# answer without a third join. The triggers on both tables are dropped
+# rather than fired once per copied row; init_* recreate them, and
+# responses_fts is rebuilt over answers by init_search.
+def _inline_answer_text(cursor):
+    if not cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'answer_text'").fetchone():
+        return
+    triggers = cursor.execute("""
+        SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('answers', 'answer_text')
+    """)
+    for (trigger,) in triggers.fetchall():
+        cursor.execute(f"DROP TRIGGER {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS responses_fts")
+    cursor.execute("DROP VIEW IF EXISTS responses")
+    cursor.execute("ALTER TABLE answers ADD COLUMN response TEXT")
+    cursor.execute("""
+        UPDATE answers SET response = answer_text.response
+        FROM answer_text WHERE answer_text.answer_id = answers.id
+    """)
+    cursor.execute("DROP TABLE answer_text")
+    create_answer_tables(cursor)
+
+MIGRATIONS = (
+    (1, _normalize_responses),
+    (2, _join_responses_view),
+    (3, _inline_answer_text),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Applies the pending migrations on `conn`, which must not be in a
+# transaction; returns the versions applied
+def migrate(conn):
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = schema_version(conn)
+        applied = []
+        cursor = conn.cursor()
+        for target, upgrade in MIGRATIONS:
+            if version < target:
+                upgrade(cursor)
+                applied.append(target)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return applied
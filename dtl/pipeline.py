@@ -0,0 +1,92 @@
+# Hierarchical map-reduce regulation generation.
+#
+# Answer clusters are split into fixed-size shards that are summarised in
+# parallel (map), then the partial guideline sets are merged a few at a
+# time until a single regulation document remains (reduce). Every prompt
+# is bounded by the shard size or the fan-in, never by the total number
+# of respondents.
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from dtl.prompts import prepare_cluster_prompt, prepare_reduce_prompt, prepare_revision_prompt
+
+CLUSTER_SHARD_SIZE = 40  # answer clusters per map prompt
+REDUCE_FAN_IN = 4
+MAX_WORKERS = 4
+
+def shard(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+# Lazily cut any iterable into lists of `size`
+def iter_shards(items, size):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+# Map step: one partial guideline set per shard of answer clusters (or of
+# whatever items `prepare` turns into a prompt). `clusters` may be any
+# iterable; shards are prepared only as worker slots free up, so at most
+# 2 * max_workers shards are held in memory.
+# on_progress(done, total) is called as each shard finishes; total is None
+# when the number of shards is not known up front.
+def batch_process_responses(clusters, generate, batch_size=CLUSTER_SHARD_SIZE, max_workers=MAX_WORKERS,
+                            on_progress=None, prepare=prepare_cluster_prompt):
+    total = -(-len(clusters) // batch_size) if hasattr(clusters, "__len__") else None
+    prompts = (prompt for prompt in map(prepare, iter_shards(clusters, batch_size)) if prompt)
+    partials = []
+    pending = deque()
+    done = 0
+
+    def collect():
+        nonlocal done
+        partials.append(pending.popleft().result())
+        done += 1
+        if on_progress:
+            on_progress(done, total)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for prompt in prompts:
+            if len(pending) >= 2 * max_workers:
+                collect()
+            pending.append(executor.submit(generate, prompt))
+        while pending:
+            collect()
+    return [partial for partial in partials if partial]
+
+def _reduce_level(partials, generate, fan_in, max_workers):
+    prompts = [prepare_reduce_prompt(group) for group in shard(partials, fan_in)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        merged = list(executor.map(generate, prompts))
+    return [text for text in merged if text]
+
+# Reduce step: merge partials fan_in at a time until one prompt's worth is
+# left, then run the final consolidation. The closed-ended statistics are
+# folded in by that final merge only, so with statistics even a single
+# partial gets one consolidating pass. The final call goes through
+# `finalize` when given (e.g. to stream it) and runs on the caller's thread.
+def reduce_guidelines(partials, generate, fan_in=REDUCE_FAN_IN, max_workers=MAX_WORKERS, statistics=None,
+                      finalize=None):
+    while len(partials) > fan_in:
+        partials = _reduce_level(partials, generate, fan_in, max_workers)
+    if len(partials) > 1 or statistics:
+        return (finalize or generate)(prepare_reduce_prompt(partials, final=True, statistics=statistics))
+    return partials[0] if partials else None
+
+def generate_regulations(clusters, generate, statistics=None, finalize=None, on_progress=None,
+                         batch_size=CLUSTER_SHARD_SIZE, fan_in=REDUCE_FAN_IN, max_workers=MAX_WORKERS,
+                         prepare=prepare_cluster_prompt):
+    partials = batch_process_responses(clusters, generate, batch_size, max_workers, on_progress, prepare)
+    return reduce_guidelines(partials, generate, fan_in, max_workers, statistics, finalize)
+
+# Incremental update: summarise only the new answers, merge them down to
+# at most fan_in guideline sets and ask the model to revise the previous document
+def revise_regulations(previous, clusters, generate, statistics=None, finalize=None, on_progress=None,
+                       batch_size=CLUSTER_SHARD_SIZE, fan_in=REDUCE_FAN_IN, max_workers=MAX_WORKERS,
+                       prepare=prepare_cluster_prompt):
+    partials = batch_process_responses(clusters, generate, batch_size, max_workers, on_progress, prepare)
+    while len(partials) > fan_in:
+        partials = _reduce_level(partials, generate, fan_in, max_workers)
+    if not partials and not statistics:
+        return None
+    return (finalize or generate)(prepare_revision_prompt(previous, partials, statistics))
@@ -0,0 +1,103 @@
+from dtl.llm import chars_per_token
+from dtl.questions import CHOICE_TYPES, SLIDER_TYPES, questions, questions_of_type
+
+MAX_ANSWER_TOKENS = 100  # longer free-text answers are cut, so a shard's prompt has a fixed ceiling
+
+CLUSTER_HEADER = "Based on the following free-text survey answers, generate ethical guidelines for autonomous vehicles. Near-duplicate answers have been grouped; the number in brackets is how many respondents gave that answer:\n\n"
+REDUCE_HEADER = "The following are partial sets of ethical guidelines for autonomous vehicles, each derived from a different group of survey respondents:\n\n"
+STATISTICS_HEADER = "Aggregated answers to the closed-ended survey questions:\n"
+MERGE_INSTRUCTION = "Merge them into one concise set of guidelines. Remove duplicates but keep every distinct point."
+REVISION_HEADER = "Here is the current regulation document for autonomous vehicles:\n\n"
+REVISION_INSTRUCTION = "Revise the regulation document to incorporate the new guidelines. Keep existing regulations unless the new input contradicts or refines them, add regulations for new points, and keep the numbering consistent. Return the full revised document."
+FINAL_INSTRUCTION = "Consolidate them into a single regulation document for AI makers. Merge duplicates, keep points where respondents disagree, and number each regulation."
+
+# Everything that shapes the prompts; part of the regulation cache key
+PROMPT_TEMPLATE = (CLUSTER_HEADER, REDUCE_HEADER, STATISTICS_HEADER, MERGE_INSTRUCTION, FINAL_INSTRUCTION,
+                   REVISION_HEADER, REVISION_INSTRUCTION)
+
+# `text` cut to about `max_tokens` of `model`'s tokens, at a word boundary
+def clip(text, max_tokens=MAX_ANSWER_TOKENS, model=None):
+    limit = int(max_tokens * chars_per_token(model))
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(None, 1)[0] + " …"
+
+# Map step over clustered free text: a shard of (question key, representative
+# answer, cluster size) tuples, grouped under their questions
+def prepare_cluster_prompt(clusters_batch, model=None):
+    if not clusters_batch:
+        return None
+    prompt = CLUSTER_HEADER
+    current_key = None
+    for key, answer, size in clusters_batch:
+        if key != current_key:
+            if current_key is not None:
+                prompt += "\n"
+            prompt += f"{questions[int(key[1:]) - 1]['question']}\n"
+            current_key = key
+        prompt += f"- [{size}] {clip(answer, model=model)}\n"
+    return prompt + "\n"
+
+# Counts and percentages for radio/selectbox questions and summary numbers
+# for sliders, a few lines per question however many respondents there are.
+# `counts` are the (question, option label, slider value, count) rows of
+# dtl.history.count_answers_since, so nothing here is per respondent.
+def format_statistics(counts):
+    choices, sliders = {}, {}
+    for key, label, value, count in counts:
+        if label is not None:
+            choices.setdefault(key, {})[label] = count
+        elif value is not None:
+            sliders.setdefault(key, {})[value] = count
+    lines = [STATISTICS_HEADER]
+    for key, item in questions_of_type(*CHOICE_TYPES):
+        answered = choices.get(key, {})
+        total = sum(answered.values())
+        if not total:
+            continue
+        # Schema options in their order, then any labels since removed from it
+        labels = [label for label in item["options"] if answered.get(label)]
+        labels += sorted(set(answered) - set(item["options"]))
+        shares = "; ".join(f"{label} {round(answered[label] / total * 100, 1):g}% ({answered[label]})"
+                           for label in labels)
+        lines.append(f"- {item['question']} (n={total}): {shares}\n")
+    for key, item in questions_of_type(*SLIDER_TYPES):
+        histogram = sorted(sliders.get(key, {}).items())
+        total = sum(count for _, count in histogram)
+        if not total:
+            continue
+        mean = sum(value * count for value, count in histogram) / total
+        lines.append(f"- {item['question']} (n={total}, scale 0-100): mean {mean:.0f}, "
+                     f"median {_median(histogram, total):.0f}, range {histogram[0][0]:.0f}-{histogram[-1][0]:.0f}\n")
+    return "".join(lines) if len(lines) > 1 else None
+
+# Median of the values in a sorted [(value, count)] histogram of `total` values
+def _median(histogram, total):
+    middle, seen, lower = (total - 1) // 2, 0, None
+    for value, count in histogram:
+        seen += count
+        if lower is None and seen > middle:
+            lower = value
+        if seen > total // 2:
+            return (lower + value) / 2
+
+# Reduce step: prompt that merges several partial guideline sets into one
+def prepare_reduce_prompt(partials, final=False, statistics=None):
+    prompt = REDUCE_HEADER
+    for set_num, partial in enumerate(partials, 1):
+        prompt += f"Guideline Set {set_num}:\n{partial.strip()}\n\n"
+    if statistics:
+        prompt += statistics + "\n"
+    prompt += FINAL_INSTRUCTION if final else MERGE_INSTRUCTION
+    return prompt
+
+# Incremental step: revise a previous regulation document with guidelines from new respondents only
+def prepare_revision_prompt(previous, partials, statistics=None):
+    prompt = REVISION_HEADER + previous.strip() + "\n\n"
+    prompt += "New guidelines derived from respondents who answered since it was written:\n\n"
+    for set_num, partial in enumerate(partials, 1):
+        prompt += f"New Guideline Set {set_num}:\n{partial.strip()}\n\n"
+    if statistics:
+        prompt += statistics + "\n"
+    prompt += REVISION_INSTRUCTION
+    return prompt
@@ -0,0 +1,252 @@
+# Questionnaire schema shared by the survey page and the prompt builders.
+# Built once at import and frozen (tuples and read-only mappings), so the
+# survey page and the prompt builders can share it without copying.
+from functools import lru_cache
+from types import MappingProxyType
+
+_definitions = [
+    {
+        "question": "Should autonomous vehicles prioritize saving passengers over pedestrians, or should every life be treated equally?",
+        "input_type": "selectbox",
+        "options": ["Prioritize Passengers", "Treat Every Life Equally", "Prioritize Pedestrians"]
+    },
+    {
+        "question": "In a situation where only one life can be saved, should age (e.g., child vs. elderly) influence the decision?",
+        "input_type": "selectbox",
+        "options": ["Yes, prioritize the younger", "No, every life is equal", "Not Sure"]
+    },
+    {
+        "question": "How should autonomous vehicles handle situations involving animals on the road? Should they prioritize human safety over animal lives?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Would you feel comfortable knowing an autonomous vehicle might sacrifice your safety to save a larger group of people?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Maybe"]
+    },
+    {
+        "question": "What ethical principles should guide the decisions of autonomous vehicles during accidents?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Should autonomous vehicles be programmed to follow traffic rules strictly, even if it means a higher risk of accidents?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Depends on the situation"]
+    },
+    {
+        "question": "How much control should humans retain over autonomous vehicles during emergencies?",
+        "input_type": "slider",
+        "min": 0,
+        "max": 100,
+        "step": 10,
+        "format": "%d%%"
+    },
+    {
+        "question": "Should autonomous vehicles always favor minimizing overall harm, even if it means choosing the 'lesser evil'?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Not Sure"]
+    },
+    {
+        "question": "Should AVs consider environmental factors (e.g., swerving into a tree vs. hitting a pedestrian) in their decision-making process?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Depends on Context"]
+    },
+    {
+        "question": "Do you think AVs should prioritize the safety of pedestrians over bicyclists or motorcyclists? Why or why not?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "How much do you trust autonomous vehicles to make ethical decisions during accidents?",
+        "input_type": "slider",
+        "min": 0,
+        "max": 100,
+        "step": 10,
+        "format": "%d%%"
+    },
+    {
+        "question": "Are you aware of any laws or guidelines that regulate the ethical behavior of autonomous vehicles?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Not Sure"]
+    },
+    {
+        "question": "How do you feel about autonomous vehicles sharing your personal data (e.g., location, driving habits) with governments or companies?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "What would make you feel more confident in adopting autonomous vehicle technology?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Are you aware of any cases where an autonomous vehicle was involved in an ethical dilemma or accident?",
+        "input_type": "text_input"
+    },
+    {
+        "question": "What concerns you most about the rise of autonomous vehicles (e.g., safety, job loss, hacking)?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Do you worry that autonomous vehicles might make biased decisions based on the data they are trained on?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Somewhat"]
+    },
+    {
+        "question": "What role should government and policymakers play in ensuring AVs make ethical decisions?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Do you think manufacturers should be held legally responsible for accidents caused by autonomous vehicles? Why or why not?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Would you trust autonomous vehicles in extreme weather conditions (e.g., heavy rain, snow, fog)? Why or why not?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "How do you think autonomous vehicles could impact community safety in crowded urban areas?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "What role should AVs play in public transportation systems to ensure inclusivity for everyone?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Do you think autonomous vehicles could help reduce discrimination in law enforcement (e.g., fewer biased stops)?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Maybe"]
+    },
+    {
+        "question": "How should AVs interact with vulnerable groups like people with disabilities, children, or the elderly in public spaces?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "What cultural differences do you think might influence how countries program their autonomous vehicles?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "How would society change if autonomous vehicles became the primary mode of transportation?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "In a future dominated by AVs, should human-driven cars be banned for safety reasons?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Not Sure"]
+    },
+    {
+        "question": "What potential benefits could AVs bring to developing countries where infrastructure is less advanced?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Do you think AVs will lead to the end of traffic accidents altogether, or will they introduce new risks?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Could AVs evolve to prioritize not just individual safety but environmental sustainability (e.g., avoiding pollution hotspots)?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Would you feel comfortable letting a car drive you without any human intervention? Why or why not?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Do you believe autonomous vehicles could reduce stress or anxiety for drivers and passengers?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Maybe"]
+    },
+    {
+        "question": "How would you cope with the idea that an AV might prioritize someone else’s life over yours in an emergency?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Do you trust machines to make moral decisions better than humans? Why or why not?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "If you were in an AV during a critical decision moment, would you prefer to be aware of what the car is doing or be left in the dark?",
+        "input_type": "radio",
+        "options": ["Prefer to be aware", "Prefer not to know", "Not Sure"]
+    },
+    {
+        "question": "Do you believe AVs should have free will to make decisions or strictly follow human-programmed rules?",
+        "input_type": "selectbox",
+        "options": ["Have Free Will", "Follow Human Rules", "Combination of Both"]
+    },
+    {
+        "question": "What does it mean for a machine to act ethically, and can machines truly understand morality?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "If an AV had to choose between saving two equally valued lives, should it act randomly or rely on a predefined rule?",
+        "input_type": "selectbox",
+        "options": ["Act Randomly", "Use Predefined Rule", "Not Sure"]
+    },
+    {
+        "question": "Should AVs be programmed with regional ethics (e.g., Western vs. Eastern values), or should there be universal standards?",
+        "input_type": "selectbox",
+        "options": ["Regional Ethics", "Universal Standards", "Not Sure"]
+    },
+    {
+        "question": "Is it ethical to make decisions about life and death using algorithms, or should humans always have the final say?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "How do you think AVs will impact jobs in driving industries (e.g., truck drivers, taxi drivers)?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Would you pay more for an AV that allows you to customize its ethical decision-making (e.g., prioritize family safety)?",
+        "input_type": "radio",
+        "options": ["Yes", "No", "Maybe"]
+    },
+    {
+        "question": "Do you think AVs will make transportation cheaper or more expensive in the long run?",
+        "input_type": "selectbox",
+        "options": ["Cheaper", "More Expensive", "Stay the Same"]
+    },
+    {
+        "question": "How should insurance policies adapt to cover accidents involving autonomous vehicles?",
+        "input_type": "text_area"
+    },
+    {
+        "question": "Who should pay for damages caused by AV malfunctions—the manufacturer, the owner, or the software provider?",
+        "input_type": "selectbox",
+        "options": ["Manufacturer", "Owner", "Software Provider", "Shared Responsibility"]
+    }
+]
+
+def _freeze(item):
+    return MappingProxyType({name: tuple(value) if isinstance(value, list) else value for name, value in item.items()})
+
+questions = tuple(_freeze(item) for item in _definitions)
+del _definitions
+
+# Options on the User Details page
+GENDER_OPTIONS = ("Male", "Female", "Other")
+KNOWS_AUTONOMOUS_OPTIONS = ("Yes", "No")
+
+CHOICE_TYPES = ("radio", "selectbox")
+SLIDER_TYPES = ("slider",)
+FREE_TEXT_TYPES = ("text_area", "text_input")
+
+# Response key stored in the responses table for each question: Q1, Q2, ...
+question_keys = tuple(f"Q{idx}" for idx in range(1, len(questions) + 1))
+
+# Questions shown per page of the survey form
+SECTION_SIZE = 9
+
+# ((key, item), ...) per survey page
+sections = tuple(
+    tuple(zip(question_keys[start:start + SECTION_SIZE], questions[start:start + SECTION_SIZE]))
+    for start in range(0, len(questions), SECTION_SIZE)
+)
+
+@lru_cache(maxsize=None)
+def questions_of_type(*input_types):
+    return tuple((key, item) for key, item in zip(question_keys, questions) if item["input_type"] in input_types)
+
+# Value a question's widget starts at when it has not been answered yet
+def default_answer(item):
+    if item["input_type"] in CHOICE_TYPES:
+        return item["options"][0]
+    if item["input_type"] in SLIDER_TYPES:
+        return item["min"]
+    return ""
@@ -0,0 +1,176 @@
+# Full-text search over forum posts, comments and free-text responses.
+#
+# Each source table gets an external-content FTS5 index (the text is not
+# stored twice) kept in sync by insert/update/delete triggers, so
+# insert_post, insert_comment and insert_responses need no changes.
+# Results are ranked by bm25. Responses are indexed from answers.response,
+# which is NULL for everything but free text, and only rows with text are
+# indexed; radio/slider answers would just match "Yes" and "No".
+#
+# On a server database the same searches run on PostgreSQL full-text search
+# over GIN expression indexes, created with the schema (see dtl.postgres).
+# ts_rank is negated so that, as with bm25, lower scores rank first, and
+# ts_headline cuts the snippets.
+import re
+
+from dtl.db import connection, get_backend
+from dtl.metrics import instrumented
+
+RESULTS_LIMIT = 20
+TEXT_SEARCH_CONFIG = "english"  # PostgreSQL text search configuration of the GIN indexes and queries
+
+_term_pattern = re.compile(r"\w+", re.UNICODE)
+
+# Rows whose column is NULL are not indexed, so they are not deleted from
+# the index either
+def _sync_triggers(fts, table, column, rowid="id"):
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} WHEN new.{column} IS NOT NULL BEGIN
+                INSERT INTO {fts} (rowid, {column}) VALUES (new.{rowid}, new.{column});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} WHEN old.{column} IS NOT NULL BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', old.{rowid}, old.{column});
+            END""",
+        # One trigger so the old row is always removed before the new one is added
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column})
+                SELECT 'delete', old.{rowid}, old.{column} WHERE old.{column} IS NOT NULL;
+                INSERT INTO {fts} (rowid, {column}) SELECT new.{rowid}, new.{column} WHERE new.{column} IS NOT NULL;
+            END""",
+    ]
+
+def init_search():
+    # (index, content table, column, rowid column)
+    indexes = (
+        ("posts_fts", "posts", "content", "id"),
+        ("comments_fts", "comments", "content", "id"),
+        ("responses_fts", "answers", "response", "id"),
+    )
+    with connection() as conn:
+        cursor = conn.cursor()
+        for fts, table, column, rowid in indexes:
+            exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).fetchone()
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts}
+                USING fts5({column}, content='{table}', content_rowid='{rowid}', tokenize='porter unicode61')
+            """)
+            for trigger in _sync_triggers(fts, table, column, rowid):
+                cursor.execute(trigger)
+            # Index rows written before the search index existed
+            if not exists:
+                cursor.execute(f"""
+                    INSERT INTO {fts} (rowid, {column}) SELECT {rowid}, {column} FROM {table} WHERE {column} IS NOT NULL
+                """)
+
+# Free text from a search box to an FTS5 query: every word must match
+# (prefix match on the last one, for search-as-you-type); operators and
+# quotes typed by the user are treated as plain text
+def to_match_query(text):
+    terms = _term_pattern.findall(text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+# The same for PostgreSQL's to_tsquery: every word, the last as a prefix
+def to_tsquery_text(text):
+    terms = _term_pattern.findall(text)
+    if not terms:
+        return None
+    return " & ".join(terms) + ":*"
+
+def _document(column):
+    return f"to_tsvector('{TEXT_SEARCH_CONFIG}', COALESCE({column}, ''))"
+
+_HEADLINE_OPTIONS = "StartSel=**, StopSel=**, MaxWords=16, MinWords=8"
+
+_FORUM_QUERIES = {
+    "sqlite": """
+        SELECT 'post', posts.id, posts.id, users.name,
+               snippet(posts_fts, 0, '**', '**', '…', 16), bm25(posts_fts) AS score
+        FROM posts_fts
+        JOIN posts ON posts.id = posts_fts.rowid
+        JOIN users ON users.id = posts.user_id
+        WHERE posts_fts MATCH ?
+        UNION ALL
+        SELECT 'comment', comments.id, comments.post_id, users.name,
+               snippet(comments_fts, 0, '**', '**', '…', 16), bm25(comments_fts) AS score
+        FROM comments_fts
+        JOIN comments ON comments.id = comments_fts.rowid
+        JOIN users ON users.id = comments.user_id
+        WHERE comments_fts MATCH ?
+        ORDER BY score
+        LIMIT ?
+    """,
+    "postgresql": f"""
+        SELECT 'post', posts.id, posts.id, users.name,
+               ts_headline('{TEXT_SEARCH_CONFIG}', posts.content, query, '{_HEADLINE_OPTIONS}'),
+               -ts_rank({_document("posts.content")}, query) AS score
+        FROM posts
+        JOIN users ON users.id = posts.user_id
+        CROSS JOIN to_tsquery('{TEXT_SEARCH_CONFIG}', ?) AS query
+        WHERE {_document("posts.content")} @@ query
+        UNION ALL
+        SELECT 'comment', comments.id, comments.post_id, users.name,
+               ts_headline('{TEXT_SEARCH_CONFIG}', comments.content, query, '{_HEADLINE_OPTIONS}'),
+               -ts_rank({_document("comments.content")}, query) AS score
+        FROM comments
+        JOIN users ON users.id = comments.user_id
+        CROSS JOIN to_tsquery('{TEXT_SEARCH_CONFIG}', ?) AS query
+        WHERE {_document("comments.content")} @@ query
+        ORDER BY score
+        LIMIT ?
+    """,
+}
+
+_RESPONSE_QUERIES = {
+    "sqlite": """
+        SELECT responses.id, responses.user_id, responses.question, responses.response,
+               bm25(responses_fts) AS score
+        FROM responses_fts
+        JOIN responses ON responses.id = responses_fts.rowid
+        WHERE responses_fts MATCH ? AND (? IS NULL OR responses.question = ?)
+        ORDER BY score
+        LIMIT ?
+    """,
+    "postgresql": f"""
+        SELECT answers.id, answers.user_id, survey_questions.key, answers.response,
+               -ts_rank({_document("answers.response")}, query) AS score
+        FROM answers
+        JOIN survey_questions ON survey_questions.id = answers.question_id
+        CROSS JOIN to_tsquery('{TEXT_SEARCH_CONFIG}', ?) AS query
+        WHERE answers.response IS NOT NULL AND {_document("answers.response")} @@ query
+              AND (? IS NULL OR survey_questions.key = ?)
+        ORDER BY score
+        LIMIT ?
+    """,
+}
+
+def _search_query(dialect, text):
+    return to_match_query(text) if dialect == "sqlite" else to_tsquery_text(text)
+
+# Ranked forum hits: (kind, id, post_id, author, snippet, score), best first
+@instrumented()
+def search_forum(text, limit=RESULTS_LIMIT):
+    dialect = get_backend().dialect
+    query = _search_query(dialect, text)
+    if query is None:
+        return []
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_FORUM_QUERIES[dialect], (query, query, limit))
+        return cursor.fetchall()
+
+# Free-text answers most relevant to a topic, for pulling opinions into a
+# prompt: (id, user_id, question, response, score), best first
+@instrumented()
+def search_responses(text, question=None, limit=RESULTS_LIMIT):
+    dialect = get_backend().dialect
+    query = _search_query(dialect, text)
+    if query is None:
+        return []
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_RESPONSE_QUERIES[dialect], (query, question, question, limit))
+        return cursor.fetchall()
@@ -0,0 +1,141 @@
+# Regulation generation as a background job.
+#
+# The Regulation Generator page only decides which snapshot of responses
+# needs a regulation and enqueues a job for it; the map-reduce pipeline
+# then runs on a worker thread and publishes progress, the partially
+# streamed text and its timing stats on the job row for the page to poll.
+import logging
+import time
+from contextlib import closing
+from functools import partial
+
+from dtl.budget import budget_clusters
+from dtl.cache import cache_regulations, regulation_key
+from dtl.history import count_answers_since, fetch_free_text_since, latest_regulation, save_regulation
+from dtl.jobs import enqueue, register
+from dtl.llm import CONTEXT_TOKENS, OUTPUT_TOKENS, StreamStats, get_client
+from dtl.metrics import measure
+from dtl.embeddings import update_embeddings
+from dtl.pipeline import CLUSTER_SHARD_SIZE, generate_regulations, revise_regulations
+from dtl.prompts import format_statistics, prepare_cluster_prompt
+
+REGULATION_JOB = "regulations"
+# Sent as Ollama's "options"; with the prompt budget (dtl.budget) they bound every call
+GENERATION_OPTIONS = {"temperature": 0.7, "num_predict": OUTPUT_TOKENS, "num_ctx": CONTEXT_TOKENS}
+PUBLISH_INTERVAL = 0.5  # seconds between partial-text updates on the job row
+
+logger = logging.getLogger(__name__)
+
+def request_regulation(prompt):
+    return get_client().generate(prompt, options=GENERATION_OPTIONS)
+
+# Variant for the map-reduce workers: a failed shard is logged and dropped
+def request_regulation_quietly(prompt):
+    import requests
+    try:
+        return request_regulation(prompt)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Regulation request failed: %s", e)
+        return None
+
+def format_stream_stats(stats):
+    if stats.time_to_first_token is None:
+        return None
+    return (f"Time to first token: {stats.time_to_first_token:.2f}s · "
+            f"{stats.tokens} tokens at {stats.tokens_per_second:.1f} tokens/s")
+
+# Streams the final generation onto the job row. Job.progress raises
+# JobCancelled when the page asked to stop; leaving the with block then
+# closes the HTTP response.
+def _streaming_finalize(job):
+    def finalize(prompt):
+        stats = StreamStats()
+        regulations = ""
+        published = 0.0
+        with closing(get_client().stream_text(prompt, stats, options=GENERATION_OPTIONS)) as fragments:
+            for fragment in fragments:
+                regulations += fragment
+                now = time.perf_counter()
+                if now - published >= PUBLISH_INTERVAL:
+                    job.progress(0.9, format_stream_stats(stats) or "Writing regulations", partial=regulations)
+                    published = now
+        job.progress(0.99, format_stream_stats(stats), partial=regulations)
+        return regulations
+    return finalize
+
+# What a generation over the responses in (since, until] sends to the
+# model: the answer clusters that fit the token budget, the number of
+# respondents sampled for them (None when no sample was needed), the
+# closed-ended statistics and the number of respondents. Only free text is
+# read row by row; the statistics are aggregated in SQL.
+def regulation_inputs(model, since, until):
+    # Near-duplicate free-text answers are collapsed before anything reaches the model, and
+    # respondents are sampled by demographics when there are more than the token budget allows
+    update_embeddings()
+    clusters, sampled = budget_clusters(fetch_free_text_since(since, until), seed=until or 0, model=model)
+    counts, respondents = count_answers_since(since, until)
+    return clusters, sampled, format_statistics(counts), respondents
+
+# Map-reduce over `clusters` with the budgeted prompts; revises `previous`
+# when given, otherwise writes a new document. Also run headlessly by
+# `python -m dtl generate`.
+def generate_from_clusters(model, clusters, generate, previous=None, **options):
+    options.update(batch_size=CLUSTER_SHARD_SIZE, prepare=partial(prepare_cluster_prompt, model=model))
+    if previous:
+        return revise_regulations(previous, clusters, generate, **options)
+    return generate_regulations(clusters, generate, **options)
+
+# The generation metric records how many respondents and answer clusters
+# went in, and the sample size when the budget forced one
+def run_regulation_job(job, params):
+    with measure("tasks.generate_regulation") as fields:
+        return _generate_regulation(job, params, fields)
+
+def _generate_regulation(job, params, fields):
+    model = params["model"]
+    high_water_mark = params["high_water_mark"]
+    previous = latest_regulation(model) if params["incremental"] else None
+    clusters, sampled, statistics, respondent_count = regulation_inputs(model, previous[1] if previous else 0,
+                                                                        high_water_mark)
+    fields.update(respondents=respondent_count, clusters=len(clusters), sampled=sampled)
+    sample_note = f" (a stratified sample of {sampled})" if sampled is not None else ""
+    job.progress(0.05, f"Summarising {len(clusters)} answer clusters from {respondent_count} respondents{sample_note}")
+
+    def on_progress(done, total):
+        job.progress(0.05 + 0.8 * done / total, f"Summarised {done} of {total} shards")
+
+    # Shards that have not started yet are skipped once the job is cancelled
+    def generate(prompt):
+        job.check_cancelled()
+        return request_regulation_quietly(prompt)
+
+    regulations = generate_from_clusters(model, clusters, generate, previous[0] if previous else None,
+                                         statistics=statistics, finalize=_streaming_finalize(job),
+                                         on_progress=on_progress)
+    if not regulations:
+        raise RuntimeError("No regulations were generated. Check the API or input data.")
+
+    if not params["incremental"]:
+        cache_regulations(params["cache_key"], model, regulations)
+    save_regulation(model, regulations, high_water_mark)
+    return regulations
+
+register(REGULATION_JOB, run_regulation_job)
+
+# Job for a full regeneration over exactly these response rows
+def enqueue_full_regulation(model, responses):
+    cache_key = regulation_key(model, responses)
+    return enqueue(REGULATION_JOB, cache_key, {
+        "model": model,
+        "incremental": False,
+        "cache_key": cache_key,
+        "high_water_mark": max(row[0] for row in responses),
+    })
+
+# Job folding the responses after `since` (up to `until`) into the latest regulation
+def enqueue_incremental_regulation(model, since, until):
+    return enqueue(REGULATION_JOB, f"incremental:{model}:{since}:{until}", {
+        "model": model,
+        "incremental": True,
+        "high_water_mark": until,
+    })
@@ -0,0 +1,68 @@
+# Copies every stored respondent, forum post and saved regulation from one
+# database into the configured one, e.g. data.db into a new PostgreSQL
+# database before the app is switched over to it:
+#
+#   python -m dtl --database-url postgresql://... copy --from data.db
+#
+# Rows keep their ids, so regulation high-water marks stay valid, and the
+# target's id sequences are moved past them. The target must not hold any
+# users, answers or posts yet; its survey numbering is replaced by the
+# source's, then the current questions are added. Derived tables (the
+# embeddings, search indexes, regulation cache and jobs) are not copied:
+# the target's triggers and indexes cover the copied rows and embeddings are
+# rebuilt on the next generation. The copy runs as one transaction on the
+# target, so a failed copy leaves it empty. Run `migrate` on an old data.db
+# first.
+import time
+
+from dtl.answers import clear_codecs, sync_survey
+from dtl.db import clear_read_cache, connection, get_backend, open_backend
+
+COPY_SIZE = 10000  # rows per fetchmany from the source
+
+# (table, columns) in an order that satisfies the foreign keys
+COPIED_TABLES = (
+    ("users", ("id", "name", "age", "gender", "knows_autonomous", "timestamp")),
+    ("posts", ("id", "user_id", "content", "created_at")),
+    ("comments", ("id", "post_id", "user_id", "parent_comment_id", "content", "created_at")),
+    ("survey_questions", ("id", "key", "kind")),
+    ("survey_options", ("question_id", "option_id", "label")),
+    ("answers", ("id", "user_id", "question_id", "option_id", "value", "response")),
+    ("regulations", ("id", "model", "regulations", "high_water_mark", "created_at")),
+)
+
+def _stream(source, table, columns):
+    with source.connection() as conn:
+        cursor = source.stream_cursor(conn)
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {columns[0]}")
+        for rows in iter(lambda: cursor.fetchmany(COPY_SIZE), []):
+            yield from rows
+
+# Copies the database at `source` (SQLite file or postgresql:// URL) into
+# the configured one, whose schema must exist; on_table(table, rows,
+# seconds) is called after each table. Returns {table: rows copied}.
+def copy_database(source, on_table=None):
+    source, target = open_backend(source), get_backend()
+    if source.name == target.name:
+        raise ValueError("Source and target are the same database")
+    counts = {}
+    with connection() as conn:
+        cursor = conn.cursor()
+        for table in ("users", "answers", "posts"):
+            if cursor.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                raise ValueError(f"{target.name} already has {table}; copy into an empty database")
+        cursor.execute("DELETE FROM survey_options")
+        cursor.execute("DELETE FROM survey_questions")
+        for table, columns in COPIED_TABLES:
+            started = time.perf_counter()
+            target.bulk_insert(cursor, table, columns, _stream(source, table, columns))
+            counts[table] = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if columns[0] == "id":
+                target.reset_ids(cursor, table)
+            if on_table:
+                on_table(table, counts[table], time.perf_counter() - started)
+        sync_survey(cursor)
+    # The target's questions and options were renumbered as the source's
+    clear_codecs()
+    clear_read_cache()
+    return counts
@@ -0,0 +1,53 @@
+import itertools
+import os
+
+import pytest
+
+from dtl import db
+from dtl.answers import clear_codecs
+from dtl.bootstrap import init_storage
+
+_database_names = itertools.count()
+
+
+# Makes `target` (a SQLite path or postgresql:// URL) the configured
+# database, creates its schema and returns its backend. Call it again to
+# switch databases within a test.
+@pytest.fixture
+def use_database(monkeypatch):
+    def use(target):
+        server = target.startswith(db.SERVER_SCHEMES)
+        monkeypatch.setattr(db, "DATABASE_URL", target if server else None)
+        if not server:
+            monkeypatch.setattr(db, "DB_PATH", target)
+        clear_codecs()
+        db.clear_read_cache()
+        init_storage()
+        return db.get_backend()
+    yield use
+    clear_codecs()
+    db.clear_read_cache()
+
+
+# The configured database is a fresh SQLite file
+@pytest.fixture
+def sqlite_db(use_database, tmp_path):
+    return use_database(str(tmp_path / "data.db"))
+
+
+# One throwaway PostgreSQL server per test session, via pgserver when it is
+# installed; tests that need a server database are skipped without it
+@pytest.fixture(scope="session")
+def postgres_server(tmp_path_factory):
+    pgserver = pytest.importorskip("pgserver")
+    pytest.importorskip("psycopg")
+    pytest.importorskip("psycopg_pool")
+    return pgserver.get_server(tmp_path_factory.mktemp("pgdata"), cleanup_mode="delete")
+
+
+# URL of a new, empty database on that server
+@pytest.fixture
+def postgres_url(postgres_server):
+    name = f"dtl_test_{os.getpid()}_{next(_database_names)}"
+    postgres_server.psql(f"CREATE DATABASE {name};")
+    return postgres_server.get_uri(name)
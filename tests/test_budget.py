@@ -0,0 +1,47 @@
+import pytest
+
+from dtl import budget, db
+from dtl.budget import budget_clusters, max_calls, overrun
+
+
+@pytest.fixture
+def answers(sqlite_db):
+    for index in range(40):
+        user_id = db.insert_user(f"user{index}", 20 + index, ("Female", "Male")[index % 2], ("Yes", "No")[index % 3 == 0])
+        db.insert_responses(user_id, {"Q3": f"answer number {index} about crossings", "Q5": f"topic {index} liability",
+                                      "Q7": 50})
+    return db.fetch_data()[1]
+
+
+def test_small_surveys_are_clustered_whole(answers):
+    clusters, sampled = budget_clusters(answers)
+    assert sampled is None
+    assert sum(size for _, _, size in clusters) == 80
+
+
+# Clustering is quadratic, so it never sees more than MAX_CLUSTERED_ANSWERS
+# answers even when every cluster would fit the prompt budget
+def test_clustering_is_capped_before_it_runs(answers, monkeypatch):
+    monkeypatch.setattr(budget, "MAX_CLUSTERED_ANSWERS", 30)
+    clustered = []
+
+    def cluster_free_text(rows):
+        clustered.append(len(rows))
+        return [(row[2], row[3], 1) for row in rows]
+    monkeypatch.setattr(budget, "cluster_free_text", cluster_free_text)
+    clusters, sampled = budget_clusters(answers)
+    assert clustered and max(clustered) <= 30
+    assert sampled is not None and sampled < 40
+    assert overrun(budget.map_cost(clusters)) <= 1
+
+
+def test_same_seed_draws_the_same_sample(answers, monkeypatch):
+    monkeypatch.setattr(budget, "MAX_CLUSTERED_ANSWERS", 30)
+    assert budget_clusters(answers, seed=3) == budget_clusters(answers, seed=3)
+
+
+def test_max_calls_counts_the_reduce_tree():
+    # 16 map prompts, merged 4 at a time into 4 and then consolidated once
+    assert max_calls(4) == 16 + 4 + 1
+    assert max_calls(16) == 16 + 1
+    assert max_calls(2) == 16 + 8 + 4 + 2 + 1
@@ -0,0 +1,109 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from dtl import db, export
+from dtl.export import ExportHandler, export_table
+from dtl.questions import question_keys
+
+
+@pytest.fixture
+def filled(sqlite_db):
+    ana = db.insert_user("Ana", 30, "Female", "Yes")
+    db.insert_responses(ana, {"Q1": "Prioritize Pedestrians", "Q3": "Stop, then go", "Q7": 80})
+    ben = db.insert_user("Ben", None, "Male", "No")
+    db.insert_responses(ben, {"Q3": 'He said "slow"\nand left', "Q7": "high"})
+    db.insert_post(ana, "Who is liable?")
+    db.insert_comment(1, ben, "The maker")
+    db.insert_comment(1, ana, "Agreed", parent_comment_id=1)
+    return sqlite_db
+
+
+def read_back(path, fmt):
+    if fmt == "csv":
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    if fmt == "jsonl":
+        return pd.DataFrame([json.loads(line) for line in open(path, encoding="utf-8")])
+    return pd.read_parquet(path)
+
+
+def stored(table):
+    with db.connection() as conn:
+        cursor = conn.execute(f"SELECT * FROM {table} ORDER BY id")
+        return [column[0] for column in cursor.description], cursor.fetchall()
+
+
+# Every value comes back as written, whatever the format; CSV has no types,
+# so it is compared as text with empty strings for NULLs
+@pytest.mark.parametrize("fmt", export.EXPORT_FORMATS)
+@pytest.mark.parametrize("table", export.EXPORT_TABLES)
+def test_export_round_trip(filled, tmp_path, table, fmt):
+    path = tmp_path / f"{table}.{fmt}"
+    count = export_table(table, str(path), fmt, chunk_size=2)
+    columns, rows = stored(table)
+    assert count == len(rows)
+    frame = read_back(path, fmt)
+    assert list(frame.columns) == columns
+    if fmt == "csv":
+        expected = [["" if value is None else str(value) for value in row] for row in rows]
+    else:
+        expected = [list(row) for row in rows]
+    actual = [[None if pd.isna(value) else value for value in row] for row in frame.itertuples(index=False)]
+    assert actual == expected
+
+
+@pytest.mark.parametrize("fmt", export.EXPORT_FORMATS)
+def test_wide_export_has_one_row_per_respondent(filled, tmp_path, fmt):
+    path = tmp_path / f"wide.{fmt}"
+    assert export_table("responses", str(path), fmt, wide=True, chunk_size=2) == 2
+    frame = read_back(path, fmt).set_index("user_id")
+    assert list(frame.columns) == list(question_keys)
+    assert frame.loc[frame.index[0], "Q1"] == "Prioritize Pedestrians"
+    assert frame.loc[frame.index[1], "Q3"] == 'He said "slow"\nand left'
+    assert frame.loc[frame.index[1], "Q7"] == "high"
+
+
+@pytest.mark.parametrize("fmt", export.EXPORT_FORMATS)
+def test_empty_export_keeps_its_columns(sqlite_db, tmp_path, fmt):
+    path = tmp_path / f"wide.{fmt}"
+    assert export_table("responses", str(path), fmt, wide=True) == 0
+    if fmt == "jsonl":
+        assert path.read_text() == ""
+    else:
+        assert list(read_back(path, fmt).columns) == ["user_id", *question_keys]
+
+
+@pytest.fixture
+def export_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_DIR", str(tmp_path / "exports"))
+    (tmp_path / "exports").mkdir()
+    (tmp_path / "secret.db").write_text("not for download")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ExportHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield tmp_path / "exports", f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_export_server_streams_files_as_attachments(export_server, monkeypatch):
+    directory, base = export_server
+    monkeypatch.setattr(export, "SEND_BLOCK", 7)
+    content = b"id,name\n" + b"".join(b"%d,user%d\n" % (i, i) for i in range(1000))
+    (directory / "users 1.csv").write_bytes(content)
+    monkeypatch.setattr(export, "EXPORT_URL", base)
+    with urllib.request.urlopen(export.export_url("users 1.csv")) as response:
+        assert response.read() == content
+        assert response.headers["Content-Length"] == str(len(content))
+        assert "attachment" in response.headers["Content-Disposition"]
+
+
+@pytest.mark.parametrize("path", ["/", "/missing.csv", "/../secret.db", "/%2E%2E%2Fsecret.db", "/..%5Csecret.db"])
+def test_export_server_only_serves_the_export_directory(export_server, path):
+    _, base = export_server
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(base + path)
+    assert error.value.code == 404
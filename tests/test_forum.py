@@ -0,0 +1,76 @@
+import pytest
+
+from dtl import db
+from dtl.db import get_comment_counts, get_posts
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def database(request, use_database, tmp_path):
+    if request.param == "sqlite":
+        return use_database(str(tmp_path / "data.db"))
+    return use_database(request.getfixturevalue("postgres_url"))
+
+
+# `times` posts, one per created_at value, in insertion order; equal values
+# make posts that tie on created_at
+@pytest.fixture
+def feed(database):
+    def fill(*times):
+        user_id = db.insert_user("Ana", 30, "Female", "Yes")
+        for index, created_at in enumerate(times, 1):
+            db.insert_post(user_id, f"post {index}")
+            with db.connection() as conn:
+                conn.execute("UPDATE posts SET created_at = ? WHERE id = ?", (created_at, index))
+    return fill
+
+
+def pages(limit):
+    pages, before = [], None
+    while True:
+        page = get_posts(before=before, limit=limit)
+        pages.append([post[0] for post in page])
+        if len(page) < limit:
+            return pages
+        before = (page[-1][3], page[-1][0])
+
+
+def test_pages_walk_the_feed_newest_first(feed):
+    feed("2026-01-01 10:00:00", "2026-01-01 12:00:00", "2026-01-01 11:00:00", "2026-01-01 09:00:00",
+         "2026-01-01 13:00:00")
+    assert pages(2) == [[5, 2], [3, 1], [4]]
+
+
+# Posts with the same created_at are ordered by id and never repeated or
+# skipped, even when a page boundary falls between them
+def test_ties_on_created_at_split_across_pages(feed):
+    feed(*["2026-01-01 10:00:00"] * 5, "2026-01-01 09:00:00", "2026-01-01 11:00:00")
+    assert pages(3) == [[7, 5, 4], [3, 2, 1], [6]]
+
+
+def test_a_full_last_page_is_followed_by_an_empty_one(feed):
+    feed("2026-01-01 10:00:00", "2026-01-01 11:00:00", "2026-01-01 12:00:00", "2026-01-01 13:00:00")
+    assert pages(2) == [[4, 3], [2, 1], []]
+
+
+def test_an_empty_feed_has_one_empty_page(database):
+    assert get_posts() == []
+    assert get_comment_counts([]) == {}
+
+
+# The cursor is a position in the feed, not an offset, so posts written
+# while someone is reading do not shift the pages they go on to
+def test_new_posts_do_not_shift_later_pages(feed):
+    feed("2026-01-01 10:00:00", "2026-01-01 11:00:00", "2026-01-01 12:00:00", "2026-01-01 13:00:00")
+    first = get_posts(limit=2)
+    db.insert_post(1, "newest")
+    assert [post[2] for post in get_posts(limit=2)][0] == "newest"
+    assert [post[0] for post in get_posts(before=(first[-1][3], first[-1][0]), limit=2)] == [2, 1]
+
+
+def test_comment_counts_cover_only_posts_with_comments(feed):
+    feed("2026-01-01 10:00:00", "2026-01-01 11:00:00", "2026-01-01 12:00:00")
+    db.insert_comment(1, 1, "first")
+    db.insert_comment(1, 1, "reply", parent_comment_id=1)
+    db.insert_comment(3, 1, "other")
+    assert get_comment_counts([1, 2, 3]) == {1: 2, 3: 1}
+    assert get_comment_counts([2]) == {}
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from dtl import db
+from dtl.ingest import InvalidRecord, _deferred_triggers, ingest_file, validate_record
+from dtl.search import search_responses
+
+ANA = {"name": "Ana", "age": 30, "gender": "Female", "knows_autonomous": "Yes",
+       "responses": {"Q1": "Prioritize Pedestrians", "Q3": "Slow down near schools", "Q7": 40}}
+BEN = {"name": "Ben", "age": "41", "gender": "Male", "knows_autonomous": "No",
+       "responses": {"Q4": "Maybe", "Q5": "The maker is liable"}}
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+    return str(path)
+
+
+def schema_objects():
+    with db.connection() as conn:
+        return {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+
+
+def responses():
+    with db.connection() as conn:
+        return conn.execute("SELECT user_id, question, response FROM responses ORDER BY id").fetchall()
+
+
+@pytest.mark.parametrize("change, error", [
+    ({"name": " "}, "name is empty"),
+    ({"age": "old"}, "not a number"),
+    ({"age": 130}, "out of range"),
+    ({"gender": "female"}, "gender"),
+    ({"knows_autonomous": "Sometimes"}, "knows_autonomous"),
+    ({"responses": {"Q99": "x"}}, "unknown question Q99"),
+    ({"responses": {"Q1": "Prioritise Pedestrians"}}, "not one of the options"),
+    ({"responses": {"Q7": "high"}}, "not a number"),
+    ({"responses": {"Q7": 45}}, "off the 0-100 scale"),
+    ({"responses": {"Q7": 110}}, "off the 0-100 scale"),
+])
+def test_invalid_records_are_rejected(change, error):
+    with pytest.raises(InvalidRecord, match=error):
+        validate_record({**ANA, **change})
+
+
+def test_valid_records_are_typed():
+    assert validate_record(BEN) == (("Ben", 41, "Male", "No"), [("Q4", "Maybe"), ("Q5", "The maker is liable")])
+
+
+def test_bad_rows_are_skipped_and_reported(sqlite_db, tmp_path):
+    path = write_jsonl(tmp_path / "load.jsonl", [ANA, {**ANA, "age": -1}, BEN, {**BEN, "responses": {"Q4": "Nope"}}])
+    stats = ingest_file(path, batch_size=1)
+    assert (stats["respondents"], stats["responses"], stats["rejected"]) == (2, 5, 2)
+    assert stats["errors"] == ["record 2: age -1 is out of range", "record 4: Q4: 'Nope' is not one of the options"]
+    assert responses() == [(1, "Q1", "Prioritize Pedestrians"), (1, "Q3", "Slow down near schools"), (1, "Q7", "40"),
+                           (2, "Q4", "Maybe"), (2, "Q5", "The maker is liable")]
+
+
+def test_csv_empty_cells_are_unanswered(sqlite_db, tmp_path):
+    path = tmp_path / "load.csv"
+    path.write_text("name,age,gender,knows_autonomous,Q1,Q3,Q7\n"
+                    "Ana,30,Female,Yes,Prioritize Pedestrians,,40\n", encoding="utf-8")
+    assert ingest_file(str(path))["responses"] == 2
+    assert responses() == [(1, "Q1", "Prioritize Pedestrians"), (1, "Q7", "40")]
+
+
+# The answers index and the per-row triggers are dropped for the load; they
+# are back afterwards, and the loaded text is searchable
+def test_indexes_and_triggers_are_restored(sqlite_db, tmp_path):
+    expected = schema_objects()
+    assert {"idx_answers_user", *_deferred_triggers} <= expected
+    ingest_file(write_jsonl(tmp_path / "load.jsonl", [ANA, BEN]))
+    assert schema_objects() == expected
+    assert [row[0] for row in search_responses("schools")] == [2]
+    # The restored triggers index later writes as before
+    db.insert_responses(1, {"Q5": "Schools need crossings"})
+    assert len(search_responses("schools")) == 2
+
+
+def test_strict_load_stops_at_the_first_bad_record(sqlite_db, tmp_path):
+    expected = schema_objects()
+    path = write_jsonl(tmp_path / "load.jsonl", [ANA, {**BEN, "gender": "?"}, BEN])
+    with pytest.raises(InvalidRecord, match="record 2: gender"):
+        ingest_file(path, batch_size=1, strict=True)
+    # Batches committed before it stay, and the schema is restored all the same
+    assert [row[0] for row in responses()] == [1, 1, 1]
+    assert schema_objects() == expected
+    assert [row[0] for row in search_responses("schools")] == [2]
+
+
+def test_load_invalidates_cached_reads(sqlite_db, tmp_path):
+    assert db.fetch_data() == ([], [])
+    ingest_file(write_jsonl(tmp_path / "load.jsonl", [ANA]))
+    users, rows = db.fetch_data()
+    assert [user[1] for user in users] == ["Ana"] and len(rows) == 3
@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from dtl import jobs
+from dtl.db import connection
+from dtl.jobs import JobCancelled, WorkerPool, cancel_job, enqueue, get_job, register
+
+
+def wait_for(job_id, statuses=("done", "failed", "cancelled"), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_job(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} is still {get_job(job_id)['status']}")
+
+
+@pytest.fixture
+def pool(sqlite_db, monkeypatch):
+    monkeypatch.setattr(jobs, "POLL_INTERVAL", 0.02)
+    pools = []
+
+    def start(workers=1):
+        pools.append(WorkerPool(workers))
+        pools[-1].start()
+        return pools[-1]
+    yield start
+    # A job still running must not finish against the next test's database
+    for started in pools:
+        started.stop(wait=True)
+
+
+def test_enqueue_returns_the_active_job_for_a_snapshot(sqlite_db):
+    first = enqueue("test", "snapshot-1", {"n": 1})
+    assert enqueue("test", "snapshot-1", {"n": 1}) == first
+    assert enqueue("test", "snapshot-2") != first
+
+
+def test_worker_claims_and_runs_a_job(pool):
+    register("double", lambda job, params: str(params["n"] * 2))
+    job_id = enqueue("double", "snapshot", {"n": 21})
+    pool()
+    job = wait_for(job_id)
+    assert (job["status"], job["result"], job["progress"]) == ("done", "42", 1)
+    # A finished snapshot is reused unless the caller asks for a new run
+    assert enqueue("double", "snapshot", {"n": 21}) == job_id
+    assert enqueue("double", "snapshot", {"n": 21}, reuse_done=False) != job_id
+
+
+def test_failed_handler_records_the_error(pool):
+    def fail(job, params):
+        raise ValueError("bad input")
+    register("fail", fail)
+    job_id = enqueue("fail", "snapshot")
+    pool()
+    assert wait_for(job_id)["error"] == "bad input"
+
+
+def test_cancel_a_queued_job(sqlite_db):
+    job_id = enqueue("never-run", "snapshot")
+    cancel_job(job_id)
+    assert get_job(job_id)["status"] == "cancelled"
+
+
+def test_cancel_a_running_job(pool):
+    started = threading.Event()
+
+    def wait_for_cancel(job, params):
+        started.set()
+        while True:
+            job.progress(0.5, "working")
+            time.sleep(0.02)
+    register("slow", wait_for_cancel)
+    job_id = enqueue("slow", "snapshot")
+    pool()
+    assert started.wait(5)
+    cancel_job(job_id)
+    assert wait_for(job_id)["status"] == "cancelled"
+    with pytest.raises(JobCancelled):
+        jobs.Job(job_id).check_cancelled()
+
+
+def strand(job_id, heartbeat_age, cancel_requested=0):
+    now = time.time()
+    with connection() as conn:
+        conn.execute("UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, cancel_requested = ? "
+                     "WHERE id = ?", (now, now - heartbeat_age, cancel_requested, job_id))
+
+
+# A job left running by a process that died while its heartbeat was still
+# fresh: the new process's pool must requeue it once the heartbeat expires
+def test_job_stranded_by_a_restart_is_run_again(pool, monkeypatch):
+    monkeypatch.setattr(jobs, "STALE_SECONDS", 0.5)
+    monkeypatch.setattr(jobs, "REQUEUE_INTERVAL", 0.05)
+    register("stranded", lambda job, params: "recovered")
+    job_id = enqueue("stranded", "snapshot")
+    strand(job_id, heartbeat_age=0.1)
+    pool()
+    assert get_job(job_id)["status"] == "running"
+    assert enqueue("stranded", "snapshot") == job_id
+    job = wait_for(job_id, timeout=5)
+    assert (job["status"], job["result"]) == ("done", "recovered")
+
+
+def test_stale_job_that_was_asked_to_stop_is_cancelled(sqlite_db):
+    job_id = enqueue("stranded", "snapshot")
+    strand(job_id, heartbeat_age=jobs.STALE_SECONDS + 1, cancel_requested=1)
+    jobs.requeue_stale_jobs()
+    assert get_job(job_id)["status"] == "cancelled"
+
+
+def test_lost_heartbeat_fails_the_job(pool, monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_INTERVAL", 0.02)
+    released = threading.Event()
+
+    def beat_fails(job_id, done, lost):
+        lost.set()
+        released.set()
+    monkeypatch.setattr(jobs, "_beat", beat_fails)
+
+    def busy(job, params):
+        released.wait(5)
+        job.progress(0.5)
+    register("busy", busy)
+    job_id = enqueue("busy", "snapshot")
+    pool()
+    job = wait_for(job_id)
+    assert job["status"] == "failed" and "heartbeat" in job["error"]
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from dtl.fake_ollama import FakeOllamaHandler, start_server
+from dtl.llm import LLMClient
+
+
+# Answers 503 to the first `server.failures` requests
+class FlakyHandler(FakeOllamaHandler):
+    def do_POST(self):
+        with self.server.lock:
+            fail = self.server.failures > 0
+            self.server.failures -= fail
+        if not fail:
+            super().do_POST()
+            return
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.request_count += 1
+        self.send_error(503)
+
+
+@pytest.fixture
+def ollama():
+    servers = []
+
+    def start(**options):
+        servers.append(start_server(**options))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def client():
+    clients = []
+
+    def make(server, **options):
+        clients.append(LLMClient(f"http://127.0.0.1:{server.server_port}", backoff=0, **options))
+        return clients[-1]
+    yield make
+    for made in clients:
+        made.close()
+
+
+def test_generate_moves_model_options_into_options(ollama, client):
+    server = ollama(reply="one two three four")
+    assert client(server).generate("prompt", max_tokens=2) == "one two "
+
+
+def test_identical_prompts_in_flight_share_one_request(ollama, client):
+    server = ollama(delay=0.05, reply="a b c")
+    llm = client(server)
+    first, second = llm.submit("same prompt"), llm.submit("same prompt")
+    assert first is second
+    assert first.result() == "a b c "
+    assert server.request_count == 1
+    # Once it has finished, the same prompt is a new request
+    assert llm.generate("same prompt") == "a b c "
+    assert server.request_count == 2
+
+
+def test_concurrent_requests_are_bounded_by_the_pool(ollama, client):
+    server = ollama(delay=0.05, reply="a b c d")
+    llm = client(server, max_concurrency=2)
+    started = time.perf_counter()
+    futures = [llm.submit(f"prompt {index}") for index in range(6)]
+    assert [future.result() for future in futures] == ["a b c d "] * 6
+    # Six calls of four 50 ms tokens each, two at a time
+    assert time.perf_counter() - started >= 3 * 4 * 0.05
+
+
+def test_server_errors_are_retried(ollama, client):
+    server = ollama(reply="recovered")
+    server.RequestHandlerClass, server.failures = FlakyHandler, 2
+    assert client(server, retries=2).generate("prompt") == "recovered "
+    assert server.request_count == 3
+
+
+def test_retries_give_up_with_the_last_error(ollama, client):
+    server = ollama(reply="never")
+    server.RequestHandlerClass, server.failures = FlakyHandler, 10
+    with pytest.raises(requests.exceptions.HTTPError):
+        client(server, retries=2).generate("prompt")
+    assert server.request_count == 3
+
+
+def test_connection_errors_are_retried_then_raised(ollama, client):
+    server = ollama()
+    server.shutdown()
+    server.server_close()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client(server, retries=1).generate("prompt")
+
+
+def test_closing_a_stream_early_frees_its_slot(ollama, client):
+    server = ollama(delay=0.01, reply="a b c d e f g h")
+    llm = client(server, max_concurrency=1)
+    fragments = llm.stream_text("prompt")
+    assert next(fragments) == "a "
+    fragments.close()
+    done = threading.Event()
+    threading.Thread(target=lambda: (llm.generate("other"), done.set()), daemon=True).start()
+    assert done.wait(5)
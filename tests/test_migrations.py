@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+from dtl import db
+from dtl.answers import clear_codecs
+from dtl.migrations import SCHEMA_VERSION
+from dtl.search import search_responses
+
+LEGACY_ROWS = [
+    (1, 1, "Q1", "Prioritize Pedestrians"),
+    (2, 1, "Q3", "Slow down near schools"),
+    (3, 1, "Q7", "80"),
+    (4, 2, "Q1", "an option since renamed"),
+    (5, 2, "Q3", "Stop for pedestrians"),
+    (7, 2, "Q7", "high"),
+]
+
+
+def responses():
+    with db.connection() as conn:
+        return conn.execute("SELECT id, user_id, question, response FROM responses ORDER BY id").fetchall()
+
+
+def tables(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+    finally:
+        conn.close()
+
+
+def user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# A data.db from before the answers were normalised: one TEXT row per
+# answer, with a deleted answer (6) and a sequence past the last id
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = str(tmp_path / "data.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, age INTEGER, gender TEXT,
+                            knows_autonomous TEXT, timestamp TEXT);
+        CREATE TABLE responses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, question TEXT, response TEXT);
+        INSERT INTO users (name, age, gender, knows_autonomous) VALUES ('Ana', 30, 'Female', 'Yes'), ('Ben', 40, 'Male', 'No');
+    """)
+    conn.executemany("INSERT INTO responses (id, user_id, question, response) VALUES (?, ?, ?, ?)", LEGACY_ROWS)
+    conn.execute("UPDATE sqlite_sequence SET seq = 9 WHERE name = 'responses'")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_legacy_responses_are_migrated_unchanged(use_database, legacy_db):
+    use_database(legacy_db)
+    assert user_version(legacy_db) == SCHEMA_VERSION
+    assert responses() == LEGACY_ROWS
+    assert "legacy_responses" not in tables(legacy_db) and "answer_text" not in tables(legacy_db)
+    # Ids continue after the old sequence, so high-water marks stay valid
+    db.insert_responses(1, {"Q5": "Liability lies with the maker"})
+    assert responses()[-1] == (10, 1, "Q5", "Liability lies with the maker")
+
+
+def test_migrated_free_text_is_searchable(use_database, legacy_db):
+    use_database(legacy_db)
+    assert [row[:4] for row in search_responses("pedestrians")] == [(5, 2, "Q3", "Stop for pedestrians")]
+    db.insert_responses(2, {"Q5": "Pedestrians first"})
+    assert {row[0] for row in search_responses("pedestrians")} == {5, 10}
+
+
+# Version 2 kept free text in its own answer_text table; version 3 moves it
+# into answers.response and rebuilds the search index over answers
+def test_answer_text_moves_into_answers(use_database, legacy_db):
+    use_database(legacy_db)
+    conn = sqlite3.connect(legacy_db)
+    conn.executescript("""
+        DROP TRIGGER responses_fts_ai; DROP TRIGGER responses_fts_ad; DROP TRIGGER responses_fts_au;
+        DROP TABLE responses_fts;
+        DROP VIEW responses;
+        CREATE TABLE answer_text (answer_id INTEGER PRIMARY KEY, response TEXT, FOREIGN KEY (answer_id) REFERENCES answers (id));
+        INSERT INTO answer_text SELECT id, response FROM answers WHERE response IS NOT NULL;
+        ALTER TABLE answers DROP COLUMN response;
+        CREATE VIEW responses (id, user_id, question, response) AS
+            SELECT answers.id, answers.user_id, survey_questions.key,
+                   COALESCE(survey_options.label, CAST(answers.value AS TEXT), answer_text.response)
+            FROM answers
+            JOIN survey_questions ON survey_questions.id = answers.question_id
+            LEFT JOIN survey_options ON survey_options.question_id = answers.question_id
+                                    AND survey_options.option_id = answers.option_id
+            LEFT JOIN answer_text ON answer_text.answer_id = answers.id;
+        CREATE VIRTUAL TABLE responses_fts USING fts5(response, content='answer_text', content_rowid='answer_id');
+        INSERT INTO responses_fts (rowid, response) SELECT answer_id, response FROM answer_text;
+        PRAGMA user_version = 2;
+    """)
+    conn.close()
+    clear_codecs()
+
+    use_database(legacy_db)
+    assert user_version(legacy_db) == SCHEMA_VERSION
+    assert "answer_text" not in tables(legacy_db)
+    assert responses() == LEGACY_ROWS
+    assert [row[0] for row in search_responses("schools")] == [2]
@@ -0,0 +1,62 @@
+import sys
+
+import pytest
+
+from dtl import db
+from dtl.db import SQLiteBackend, open_backend
+from dtl.postgres import translate
+
+
+def test_translate_rewrites_placeholders():
+    assert translate("SELECT * FROM users WHERE id > ? AND name = ?") == \
+        "SELECT * FROM users WHERE id > %s AND name = %s"
+
+
+def test_translate_leaves_string_literals_alone():
+    assert translate("SELECT '?', 'it''s ?', ? FROM users") == "SELECT '?', 'it''s ?', %s FROM users"
+
+
+def test_translate_escapes_percent_signs():
+    assert translate("SELECT id % 2 FROM posts WHERE content LIKE '50%' AND id = ?") == \
+        "SELECT id %% 2 FROM posts WHERE content LIKE '50%%' AND id = %s"
+
+
+def test_open_backend_picks_sqlite_for_paths(tmp_path):
+    path = str(tmp_path / "data.db")
+    backend = open_backend(path)
+    assert isinstance(backend, SQLiteBackend)
+    assert (backend.dialect, backend.name) == ("sqlite", path)
+
+
+def test_open_backend_needs_psycopg_for_urls(monkeypatch):
+    monkeypatch.setitem(sys.modules, "psycopg", None)
+    with pytest.raises(RuntimeError, match="psycopg"):
+        open_backend("postgresql://dtl@localhost/dtl")
+
+
+def test_open_backend_hides_the_password(postgres_url):
+    backend = open_backend(postgres_url.replace("postgres:@", "postgres:secret@"))
+    try:
+        assert backend.dialect == "postgresql"
+        assert "secret" not in backend.name and "postgres:***@" in backend.name
+        with backend.connection() as conn:
+            assert conn.execute("SELECT ?, '?', 7 % 3", ("x",)).fetchone() == ("x", "?", 1)
+    finally:
+        backend._pool.close()
+
+
+def test_get_backend_follows_the_configuration(use_database, tmp_path, postgres_url):
+    first = use_database(str(tmp_path / "first.db"))
+    assert db.get_backend() is first
+    second = use_database(postgres_url)
+    assert second.dialect == "postgresql" and second is not first
+    assert use_database(str(tmp_path / "first.db")) is first
+
+
+def test_server_schema_round_trips_answers(use_database, postgres_url):
+    use_database(postgres_url)
+    user_id = db.insert_user("Ana", 30, "Female", "Yes")
+    db.insert_responses(user_id, {"Q1": "Treat Every Life Equally", "Q3": "Slow down near schools", "Q7": 40})
+    assert sorted(row[1:] for row in db.fetch_data()[1]) == [
+        (user_id, "Q1", "Treat Every Life Equally"), (user_id, "Q3", "Slow down near schools"), (user_id, "Q7", "40"),
+    ]
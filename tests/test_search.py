@@ -0,0 +1,66 @@
+import pytest
+
+from dtl import db
+from dtl.search import search_forum, search_responses, to_match_query
+
+
+# Each test runs on SQLite's FTS5 tables and on PostgreSQL's GIN indexes
+@pytest.fixture(params=["sqlite", "postgresql"])
+def database(request, use_database, tmp_path):
+    if request.param == "sqlite":
+        return use_database(str(tmp_path / "data.db"))
+    return use_database(request.getfixturevalue("postgres_url"))
+
+
+@pytest.fixture
+def ana(database):
+    return db.insert_user("Ana", 30, "Female", "Yes")
+
+
+def hits(text):
+    return [(kind, item_id) for kind, item_id, *_ in search_forum(text)]
+
+
+def test_new_posts_and_comments_are_found(ana):
+    db.insert_post(ana, "Should cars brake for pedestrians?")
+    assert hits("pedestrians") == [("post", 1)]
+    db.insert_comment(1, ana, "Pedestrians always come first")
+    assert sorted(hits("pedestrians")) == [("comment", 1), ("post", 1)]
+    author, snippet = search_forum("brake")[0][3:5]
+    assert author == "Ana" and "**brake**" in snippet
+
+
+def test_edited_and_deleted_posts_leave_the_index(ana):
+    db.insert_post(ana, "Cyclists need their own lanes")
+    db.insert_post(ana, "Cyclists and scooters")
+    with db.connection() as conn:
+        conn.execute("UPDATE posts SET content = 'Buses need their own lanes' WHERE id = 1")
+        conn.execute("DELETE FROM posts WHERE id = 2")
+    assert hits("cyclists") == []
+    assert hits("buses") == [("post", 1)]
+
+
+def test_new_free_text_answers_are_found(ana):
+    db.insert_responses(ana, {"Q1": "Prioritize Pedestrians", "Q3": "Slow down near schools", "Q4": "Yes"})
+    bob = db.insert_user("Bob", 50, "Male", "No")
+    db.insert_responses(bob, {"Q5": "Schools should set the limits"})
+    assert {row[:3] for row in search_responses("schools")} == {(2, ana, "Q3"), (4, bob, "Q5")}
+    assert [row[0] for row in search_responses("schools", question="Q5")] == [4]
+    # Closed-ended answers are not indexed
+    assert search_responses("pedestrians") == [] and search_responses("yes") == []
+
+
+def test_the_last_word_matches_as_a_prefix(ana):
+    db.insert_post(ana, "Autonomous shuttles downtown")
+    assert hits("autonomous shut") == [("post", 1)]
+    assert hits("shut autonomous") == []
+
+
+@pytest.mark.parametrize("text", ["", "  ", "!!"])
+def test_queries_without_words_find_nothing(ana, text):
+    db.insert_post(ana, "anything")
+    assert search_forum(text) == [] and search_responses(text) == []
+
+
+def test_search_syntax_is_treated_as_text():
+    assert to_match_query('cars OR "bikes" NEAR(x') == '"cars" "OR" "bikes" "NEAR" "x"*'
@@ -0,0 +1,104 @@
+import pytest
+
+from dtl import db
+from dtl.answers import get_codec
+from dtl.history import save_regulation
+from dtl.transfer import copy_database
+
+COMPARED = {
+    "users": "SELECT * FROM users ORDER BY id",
+    "posts": "SELECT id, user_id, content FROM posts ORDER BY id",
+    "comments": "SELECT id, post_id, user_id, parent_comment_id, content FROM comments ORDER BY id",
+    "responses": "SELECT * FROM responses ORDER BY id",
+    "regulations": "SELECT id, model, regulations, high_water_mark FROM regulations ORDER BY id",
+}
+
+
+def add_respondent(name, responses):
+    user_id = db.insert_user(name, 30, "Female", "Yes")
+    db.insert_responses(user_id, responses)
+    return user_id
+
+
+# Respondents, a forum thread and a regulation in the configured database
+def fill():
+    first = add_respondent("Ana", {"Q1": "Prioritize Pedestrians", "Q3": "Stop for children", "Q4": "Maybe", "Q7": 80})
+    second = add_respondent("Ben", {"Q1": "Something else", "Q3": "It's 100% the maker's fault?", "Q7": "high"})
+    db.insert_post(first, "Who is liable?")
+    db.insert_comment(1, second, "The maker")
+    db.insert_comment(1, first, "Agreed", parent_comment_id=1)
+    save_regulation("llama3.1", "1. Be safe.", 7)
+
+
+def contents():
+    with db.connection() as conn:
+        return {table: [tuple(row) for row in conn.execute(sql).fetchall()] for table, sql in COMPARED.items()}
+
+
+@pytest.fixture
+def source(use_database, tmp_path):
+    path = str(tmp_path / "source.db")
+    use_database(path)
+    fill()
+    return path, contents()
+
+
+def test_copy_sqlite_to_sqlite(use_database, tmp_path, source):
+    path, expected = source
+    use_database(str(tmp_path / "target.db"))
+    counts = copy_database(path)
+    assert contents() == expected
+    assert (counts["users"], counts["answers"], counts["comments"]) == (2, 7, 2)
+
+    # New rows continue after the copied ids and decode with the copied numbering
+    user_id = add_respondent("Cy", {"Q4": "No"})
+    assert user_id == 3
+    assert contents()["responses"][-1] == (8, 3, "Q4", "No")
+
+
+def test_copy_sqlite_to_postgres(use_database, postgres_url, source):
+    path, expected = source
+    use_database(postgres_url)
+    copy_database(path)
+    assert contents() == expected
+    assert add_respondent("Cy", {"Q4": "No"}) == 3
+    assert contents()["responses"][-1] == (8, 3, "Q4", "No")
+
+
+def test_copy_postgres_to_sqlite(use_database, postgres_url, tmp_path, source):
+    path, expected = source
+    use_database(postgres_url)
+    copy_database(path)
+    use_database(str(tmp_path / "target.db"))
+    copy_database(postgres_url)
+    assert contents() == expected
+
+
+def test_copy_refuses_a_database_with_data(use_database, source):
+    path, expected = source
+    with pytest.raises(ValueError, match="empty database"):
+        copy_database(str(path) + "-other")
+    assert contents() == expected
+
+
+def test_copy_refuses_to_copy_onto_itself(use_database, source):
+    path, _ = source
+    with pytest.raises(ValueError, match="same database"):
+        copy_database(path)
+
+
+# A codec cached for the target before the copy has the target's old
+# option numbering; the copy has to drop it
+def test_copy_resets_cached_codecs(use_database, tmp_path):
+    path = str(tmp_path / "source.db")
+    use_database(path)
+    with db.connection() as conn:
+        conn.execute("UPDATE survey_options SET option_id = option_id + 100")
+    add_respondent("Ana", {"Q4": "No"})
+    target = use_database(str(tmp_path / "target.db"))
+    with db.connection() as conn:
+        get_codec(conn.cursor(), target.name)
+
+    copy_database(path)
+    add_respondent("Ben", {"Q4": "No"})
+    assert [row[1:] for row in contents()["responses"]] == [(1, "Q4", "No"), (2, "Q4", "No")]
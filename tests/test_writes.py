@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+
+import pytest
+
+from dtl import db
+from dtl.db import WriteQueue
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    path = str(tmp_path / "writes.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, text TEXT UNIQUE)")
+    conn.close()
+    groups = []
+    commit = WriteQueue._commit
+
+    def recording_commit(self, conn, group):
+        groups.append(len(group))
+        return commit(self, conn, group)
+    monkeypatch.setattr(WriteQueue, "_commit", recording_commit)
+    return WriteQueue(path), groups, path
+
+
+def insert(text):
+    def op(cursor):
+        cursor.execute("INSERT INTO notes (text) VALUES (?)", (text,))
+        return cursor.lastrowid
+    return op
+
+
+def notes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [text for (text,) in conn.execute("SELECT text FROM notes ORDER BY id")]
+    finally:
+        conn.close()
+
+
+# Holds the writer thread inside a write until `released` is set, so that
+# the writes submitted meanwhile queue up behind it; returns once the
+# thread is held
+def hold(queue, released):
+    started = threading.Event()
+
+    def op(cursor):
+        started.set()
+        released.wait(5)
+    future = queue.submit(op)
+    assert started.wait(5)
+    return future
+
+
+def test_queued_writes_commit_as_one_group(writer):
+    queue, groups, path = writer
+    released = threading.Event()
+    first = hold(queue, released)
+    futures = [queue.submit(insert(f"note {index}")) for index in range(5)]
+    released.set()
+    assert [future.result(5) for future in futures] == [1, 2, 3, 4, 5]
+    first.result(5)
+    assert groups == [1, 5]
+    assert notes(path) == [f"note {index}" for index in range(5)]
+
+
+def test_groups_are_capped(writer, monkeypatch):
+    monkeypatch.setattr(db, "MAX_GROUP_WRITES", 2)
+    queue, groups, _ = writer
+    released = threading.Event()
+    hold(queue, released)
+    futures = [queue.submit(insert(f"note {index}")) for index in range(5)]
+    released.set()
+    for future in futures:
+        future.result(5)
+    assert groups == [1, 2, 2, 1]
+
+
+# A failing write gets its own exception and is rolled back to its
+# savepoint; the writes grouped with it still commit
+def test_a_failing_write_does_not_affect_its_group(writer):
+    queue, groups, path = writer
+    released = threading.Event()
+    hold(queue, released)
+
+    def insert_then_fail(cursor):
+        cursor.execute("INSERT INTO notes (text) VALUES ('partial')")
+        raise ValueError("bad write")
+    before = queue.submit(insert("before"))
+    failing = queue.submit(insert_then_fail)
+    duplicate = queue.submit(insert("before"))
+    after = queue.submit(insert("after"))
+    released.set()
+    assert before.result(5) == 1
+    with pytest.raises(ValueError, match="bad write"):
+        failing.result(5)
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.result(5)
+    assert after.result(5)
+    assert groups == [1, 4]
+    assert notes(path) == ["before", "after"]
+
+
+def test_write_returns_the_result_after_commit(sqlite_db):
+    user_id = db.insert_user("Ana", 30, "Female", "Yes")
+    with db.connection() as conn:
+        assert conn.execute("SELECT name FROM users WHERE id = ?", (user_id,)).fetchone() == ("Ana",)